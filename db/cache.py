@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from starlette.responses import Response
+import functools, hashlib, json, os, threading, time
+
+# Response cache for read-heavy routes. Entries are keyed on the route's
+# normalized parameters plus a per-namespace generation number; a write to any
+# table a namespace depends on bumps the generation, so the old entries are
+# never read again and simply age out.
+#
+# RESPONSE_CACHE_BACKEND: "memory" (default, per process), "redis" (shared by
+# every worker, needs REDIS_URL and the redis package) or "none".
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryCacheBackend:
+    """In-process TTL + LRU store. Invalidations only reach this process."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: int):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def generation(self, namespace: str) -> int:
+        with self.lock:
+            return self.generations.get(namespace, 0)
+
+    def bump(self, namespace: str):
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+
+    def size(self) -> int:
+        return len(self.entries)
+
+
+class RedisCacheBackend:
+    """Shared store, so a write on one worker invalidates every worker."""
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(f"response:{key}")
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl: int):
+        self.client.set(f"response:{key}", json.dumps(value, default=str), ex=ttl)
+
+    def generation(self, namespace: str) -> int:
+        return int(self.client.get(f"generation:{namespace}") or 0)
+
+    def bump(self, namespace: str):
+        self.client.incr(f"generation:{namespace}")
+
+    def size(self):
+        return None
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "none":
+        return None
+    if name == "redis":
+        try:
+            return RedisCacheBackend()
+        except Exception as e:
+            print(f"Redis response cache unavailable, falling back to memory: {e}")
+    return MemoryCacheBackend()
+
+
+backend = create_backend()
+
+# table name -> namespaces whose cached responses read from it
+namespaces_by_table = {}
+
+# namespace -> {"hits", "misses", "invalidations"}, updated from the threadpool
+cache_counters = {}
+counters_lock = threading.Lock()
+
+
+def count(namespace: str, counter: str):
+    with counters_lock:
+        cache_counters[namespace][counter] += 1
+
+
+def cache_key(namespace: str, generation: int, params: dict) -> str:
+    """
+    Stable key for a call. None values are dropped and list values are sorted,
+    so ?skills=a&skills=b and ?skills=b&skills=a share an entry.
+    """
+    normalized = {
+        key: sorted(value) if isinstance(value, (list, tuple, set)) else value
+        for key, value in params.items()
+        if value is not None
+    }
+    digest = hashlib.sha1(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{namespace}:{generation}:{digest}"
+
+
+# response headers stored with a cached body
+CACHED_HEADERS = ("x-next-cursor",)
+
+
+def to_cacheable(value):
+    """Pre-serialized responses are stored as their body, so every backend can hold them."""
+    if isinstance(value, Response):
+        return {
+            "__response_body__": value.body.decode(), "media_type": value.media_type, "status_code": value.status_code,
+            "headers": {name: value.headers[name] for name in CACHED_HEADERS if name in value.headers}
+        }
+    return value
+
+
+def from_cacheable(value):
+    if isinstance(value, dict) and "__response_body__" in value:
+        return Response(
+            content=value["__response_body__"], media_type=value["media_type"], status_code=value["status_code"],
+            headers=value.get("headers")
+        )
+    return value
+
+
+def cached_response(namespace: str, tables: tuple, ttl: int = CACHE_TTL, skip: tuple = ("db",)):
+    """
+    Route decorator caching a sync handler's return value. `tables` lists every
+    table the response is built from; `skip` names the arguments (sessions)
+    that are not part of the key. Raised exceptions are never cached.
+    """
+    for table in tables:
+        namespaces_by_table.setdefault(table, set()).add(namespace)
+    with counters_lock:
+        cache_counters.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if backend is None:
+                return func(*args, **kwargs)
+
+            # Read the generation before querying: if a write lands while the
+            # handler runs, the result is stored under the old generation.
+            params = {key: value for key, value in kwargs.items() if key not in skip}
+            try:
+                key = cache_key(namespace, backend.generation(namespace), params)
+                value = backend.get(key)
+            except Exception as e:
+                print(f"Error reading response cache {namespace}: {e}")
+                return func(*args, **kwargs)
+            if value is not None:
+                count(namespace, "hits")
+                return from_cacheable(value)
+
+            count(namespace, "misses")
+            value = func(*args, **kwargs)
+            try:
+                backend.set(key, to_cacheable(value), ttl)
+            except Exception as e:
+                print(f"Error writing response cache {namespace}: {e}")
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate_table(table_name: str):
+    """Drops the cached responses built from `table_name`, called after every committed write."""
+    if backend is None:
+        return
+    for namespace in namespaces_by_table.get(table_name, ()):
+        try:
+            backend.bump(namespace)
+            count(namespace, "invalidations")
+        except Exception as e:
+            print(f"Error invalidating response cache {namespace}: {e}")
+
+
+def cache_stats() -> dict:
+    """Backend, entry count and per-namespace hit/miss/invalidation counters."""
+    with counters_lock:
+        namespaces = {namespace: dict(counters) for namespace, counters in cache_counters.items()}
+    return {
+        "backend": backend.name if backend else "none",
+        "ttl": CACHE_TTL,
+        "entries": backend.size() if backend else 0,
+        "namespaces": namespaces
+    }
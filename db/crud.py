@@ -1,6 +1,10 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.expression import literal
-from sqlalchemy import text, or_, and_, func
+from sqlalchemy import text, or_, and_, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db.cache import invalidate_table
+import base64, json, os
 
 # Insert Data
 def insert_data(session: Session, model, data: dict):
@@ -9,6 +13,7 @@ def insert_data(session: Session, model, data: dict):
         new_record = model(**data)
         session.add(new_record)
         session.commit()
+        invalidate_table(model.__tablename__)
         print(f"Inserted into {model.__tablename__} with ID: {new_record.id}")
         return new_record
     except Exception as e:
@@ -25,6 +30,7 @@ def update_data(session: Session, model, filters: dict, update_values: dict):
             for key, value in update_values.items():
                 setattr(record, key, value)
             session.commit()
+            invalidate_table(model.__tablename__)
             print(f"Updated {model.__tablename__} where {filters}")
             return record
         else:
@@ -43,6 +49,7 @@ def delete_data(session: Session, model, filters: dict):
         if record:
             session.delete(record)
             session.commit()
+            invalidate_table(model.__tablename__)
             print(f"Deleted from {model.__tablename__} where {filters}")
             return True
         else:
@@ -53,26 +60,128 @@ def delete_data(session: Session, model, filters: dict):
         print(f"Error deleting from {model.__tablename__}: {e}")
         return False
 
-def get_data(session: Session, model, filters=None):
-    """Fetches records from the database with support for both list and dict filters."""
+# Operators understood by build_filters. A plain value means "eq" and a
+# list/tuple/set means "in"; anything else is spelled out as {"<op>": operand}.
+FILTER_OPERATORS = ("eq", "in", "prefix", "ilike", "range", "is_null", "contains")
+
+def escape_like(value: str) -> str:
+    """Escapes LIKE wildcards so user input is matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def build_condition(model, key, value):
+    """
+    Builds a single criterion for `model.key`.
+
+    Examples:
+        {"email": "a@b.com"}                  -> email = 'a@b.com'
+        {"id": [1, 2, 3]}                     -> id IN (1, 2, 3)
+        {"name": {"prefix": "Ac"}}            -> name LIKE 'Ac%'
+        {"name": {"ilike": "acme"}}           -> name ILIKE '%acme%'
+        {"id": {"range": [10, None]}}         -> id >= 10
+        {"resume": {"is_null": True}}         -> resume IS NULL
+        {"skills": {"contains": ["Python"]}}  -> skills @> '["Python"]' (JSONB)
+    """
+    column = getattr(model, key)
+
+    if isinstance(value, dict):
+        if len(value) != 1:
+            raise ValueError(f"Filter on {key} must have exactly one operator, got {list(value)}")
+        op, operand = next(iter(value.items()))
+    elif isinstance(value, (list, tuple, set)):
+        op, operand = "in", value
+    else:
+        op, operand = "eq", value
+
+    if op == "eq":
+        return column.is_(None) if operand is None else column == operand
+    if op == "in":
+        return column.in_(list(operand))
+    if op == "prefix":
+        # left-anchored, so a text_pattern_ops btree index can serve it
+        return column.like(f"{escape_like(operand)}%", escape="\\")
+    if op == "ilike":
+        return column.ilike(f"%{escape_like(operand)}%", escape="\\")
+    if op == "range":
+        low, high = operand
+        bounds = []
+        if low is not None:
+            bounds.append(column >= low)
+        if high is not None:
+            bounds.append(column <= high)
+        return and_(*bounds)
+    if op == "is_null":
+        return column.is_(None) if operand else column.isnot(None)
+    if op == "contains":
+        return column.contains(operand)
+
+    raise ValueError(f"Unknown filter operator '{op}' for {key}, expected one of {FILTER_OPERATORS}")
+
+def build_filters(model, filters=None):
+    """Turns list or dict filters into a list of SQLAlchemy criteria."""
+    if not filters:
+        return []
+
+    if isinstance(filters, list):  # New format: List of dictionaries, OR-ed together
+        conditions = [
+            and_(*(build_condition(model, key, value) for key, value in f.items()))
+            for f in filters
+        ]
+        return [or_(*conditions)]
+
+    if isinstance(filters, dict):  # Old format: Single dictionary
+        return [build_condition(model, key, value) for key, value in filters.items()]
+
+    return []
+
+# Lists requested without `limit` keep their plain array shape for existing
+# clients, but stop after LIST_MAX_ROWS rows; the cursor of the rest is sent in
+# the X-Next-Cursor response header (see db.models.base.unpaged_response).
+LIST_MAX_ROWS = int(os.getenv("LIST_MAX_ROWS", 500))
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque cursor pointing after the row with id `last_id`."""
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Reverses encode_cursor, raising ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def apply_keyset(query, model, limit: int, cursor: str = None):
+    """
+    Restricts a Query or select() to one page ordered by id. One extra row is
+    fetched so page_result can tell whether another page follows.
+    """
+    if cursor:
+        query = query.filter(model.id > decode_cursor(cursor))
+    return query.order_by(model.id).limit(limit + 1)
+
+def page_result(rows, limit: int) -> dict:
+    """Splits the rows fetched through apply_keyset into a page and its next cursor."""
+    rows = list(rows)
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(items[-1].id) if has_more else None
+    }
+
+def get_data(session: Session, model, filters=None, limit: int = None, cursor: str = None, options: list = None):
+    """
+    Fetches records from the database with support for both list and dict filters.
+
+    Values match exactly unless an operator is given, see build_condition.
+    With `limit` the result is one keyset page: {"items": [...], "next_cursor": ...}.
+    `options` are loader options, usually a profile from db.models.loading.
+    """
     try:
-        query = session.query(model)
-        
-        if filters:
-            if isinstance(filters, list):  # New format: List of dictionaries
-                conditions = [
-                    and_(*(getattr(model, key).ilike(f"%{value}%") if isinstance(value, str) else getattr(model, key) == value
-                           for key, value in f.items()))
-                    for f in filters
-                ]
-                query = query.filter(or_(*conditions))
-
-            elif isinstance(filters, dict):  # Old format: Single dictionary
-                query = query.filter(
-                    *(getattr(model, key).ilike(f"%{value}%") if isinstance(value, str) else getattr(model, key) == value
-                      for key, value in filters.items())
-                )
-                
+        query = session.query(model).filter(*build_filters(model, filters)).options(*(options or []))
+        if limit:
+            return page_result(apply_keyset(query, model, limit, cursor).all(), limit)
+
         result = query.all()
 
         if not result:
@@ -86,6 +195,63 @@ def get_data(session: Session, model, filters=None):
         print(f"Error retrieving from {model.__tablename__}: {e}")
         return {"error": str(e)}
 
+# Bulk Insert
+def insert_many(session: Session, model, rows: list):
+    """
+    Inserts many records with batched multi-row INSERTs and returns their ids
+    in the same order as `rows`. Every row must have the same keys.
+    """
+    if not rows:
+        return []
+    try:
+        stmt = pg_insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids = session.execute(stmt, rows).scalars().all()
+        session.commit()
+        invalidate_table(model.__tablename__)
+        print(f"Inserted {len(ids)} rows into {model.__tablename__}")
+        return ids
+    except Exception as e:
+        session.rollback()
+        print(f"Error bulk inserting into {model.__tablename__}: {e}")
+        return {"error": str(e)}
+
+def upsert_statement(model, rows: list, conflict_columns: list, update_columns: list = None):
+    """
+    Builds an INSERT ... ON CONFLICT statement for `rows`.
+
+    `conflict_columns` must match a unique index. Conflicting rows get
+    `update_columns` (default: every non-conflict key of the first row) from the
+    new values; with nothing to update they are skipped and return no id.
+    """
+    stmt = pg_insert(model)
+    if update_columns is None:
+        update_columns = [key for key in rows[0] if key not in conflict_columns]
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    return stmt.returning(model.id)
+
+# Bulk Upsert
+def upsert_many(session: Session, model, rows: list, conflict_columns: list, update_columns: list = None):
+    """Inserts or updates many records in one round trip and returns the affected ids."""
+    if not rows:
+        return []
+    try:
+        stmt = upsert_statement(model, rows, conflict_columns, update_columns)
+        ids = session.execute(stmt, rows).scalars().all()
+        session.commit()
+        invalidate_table(model.__tablename__)
+        print(f"Upserted {len(ids)} rows into {model.__tablename__} on {conflict_columns}")
+        return ids
+    except Exception as e:
+        session.rollback()
+        print(f"Error bulk upserting into {model.__tablename__}: {e}")
+        return {"error": str(e)}
+
 # Save Data (Insert if not exists, Update otherwise)
 def save_data(session: Session, model, data: dict, filters: dict = None):
     """Inserts a new record if no filter is found, otherwise updates it."""
@@ -112,7 +278,144 @@ def add_columns_to_table(session: Session, table_name: str, columns: dict):
             alter_sql = f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_name} {column_type};"
             session.execute(text(alter_sql))  # Uses session.execute instead of engine.connect()
         session.commit()
+        invalidate_table(table_name)
         print(f"Columns {', '.join(columns.keys())} added to {table_name} successfully!")
     except Exception as e:
         session.rollback()
-        print(f"Error modifying table {table_name}: {e}")
\ No newline at end of file
+        print(f"Error modifying table {table_name}: {e}")
+
+
+# Async counterparts of the helpers above, used by the async routes so DB round
+# trips do not block the event loop.
+
+async def async_insert_data(session: AsyncSession, model, data: dict):
+    """Inserts a new record into the database."""
+    try:
+        new_record = model(**data)
+        session.add(new_record)
+        await session.commit()
+        invalidate_table(model.__tablename__)
+        print(f"Inserted into {model.__tablename__} with ID: {new_record.id}")
+        return new_record
+    except Exception as e:
+        await session.rollback()
+        print(f"Error inserting into {model.__tablename__}: {e}")
+        return {"error": str(e)}
+
+async def async_update_data(session: AsyncSession, model, filters: dict, update_values: dict):
+    """Updates a record if it exists."""
+    try:
+        result = await session.execute(select(model).filter_by(**filters))
+        record = result.unique().scalars().first()
+        if record:
+            for key, value in update_values.items():
+                setattr(record, key, value)
+            await session.commit()
+            invalidate_table(model.__tablename__)
+            print(f"Updated {model.__tablename__} where {filters}")
+            return record
+        else:
+            print(f"No record found in {model.__tablename__} matching {filters}")
+            return {"error": f"No record found in {model.__tablename__} matching {filters}"}
+    except Exception as e:
+        await session.rollback()
+        print(f"Error updating {model.__tablename__}: {e}")
+        return None
+
+async def async_delete_data(session: AsyncSession, model, filters: dict):
+    """Deletes a record if it exists."""
+    try:
+        result = await session.execute(select(model).filter_by(**filters))
+        record = result.unique().scalars().first()
+        if record:
+            await session.delete(record)
+            await session.commit()
+            invalidate_table(model.__tablename__)
+            print(f"Deleted from {model.__tablename__} where {filters}")
+            return True
+        else:
+            print(f"No record found in {model.__tablename__} matching {filters}")
+            return False
+    except Exception as e:
+        await session.rollback()
+        print(f"Error deleting from {model.__tablename__}: {e}")
+        return False
+
+async def async_get_data(session: AsyncSession, model, filters=None, limit: int = None, cursor: str = None, options: list = None):
+    """
+    Fetches records from the database with support for both list and dict filters.
+
+    Relationships are never lazy loaded on an AsyncSession, so pass the loader
+    `options` for everything the caller touches.
+    """
+    try:
+        # populate_existing refreshes objects already in the session, which the
+        # sync session gets for free through expire_on_commit
+        stmt = (
+            select(model)
+            .filter(*build_filters(model, filters))
+            .options(*(options or []))
+            .execution_options(populate_existing=True)
+        )
+        if limit:
+            stmt = apply_keyset(stmt, model, limit, cursor)
+
+        # joined eager loads of collections return duplicate parent rows
+        result = (await session.execute(stmt)).unique().scalars().all()
+        if limit:
+            return page_result(result, limit)
+
+        if not result:
+            print(f"No record found in {model.__tablename__} matching {filters}")
+            return {"error": "No record found"}
+
+        return result
+
+    except Exception as e:
+        await session.rollback()
+        print(f"Error retrieving from {model.__tablename__}: {e}")
+        return {"error": str(e)}
+
+async def async_save_data(session: AsyncSession, model, data: dict, filters: dict = None):
+    """Inserts a new record if no filter is found, otherwise updates it."""
+    if filters:
+        result = await session.execute(select(model).filter_by(**filters))
+        existing_record = result.unique().scalars().first()
+        if existing_record:
+            print(f"Record found in {model.__tablename__}, updating...")
+            return await async_update_data(session, model, filters, data)
+
+    print(f"No matching record found in {model.__tablename__}, inserting new record...")
+    return await async_insert_data(session, model, data)
+
+async def async_insert_many(session: AsyncSession, model, rows: list):
+    """Async counterpart of insert_many."""
+    if not rows:
+        return []
+    try:
+        stmt = pg_insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids = (await session.execute(stmt, rows)).scalars().all()
+        await session.commit()
+        invalidate_table(model.__tablename__)
+        print(f"Inserted {len(ids)} rows into {model.__tablename__}")
+        return ids
+    except Exception as e:
+        await session.rollback()
+        print(f"Error bulk inserting into {model.__tablename__}: {e}")
+        return {"error": str(e)}
+
+async def async_upsert_many(session: AsyncSession, model, rows: list, conflict_columns: list, update_columns: list = None):
+    """Async counterpart of upsert_many."""
+    if not rows:
+        return []
+    try:
+        stmt = upsert_statement(model, rows, conflict_columns, update_columns)
+        ids = (await session.execute(stmt, rows)).scalars().all()
+        await session.commit()
+        invalidate_table(model.__tablename__)
+        print(f"Upserted {len(ids)} rows into {model.__tablename__} on {conflict_columns}")
+        return ids
+    except Exception as e:
+        await session.rollback()
+        print(f"Error bulk upserting into {model.__tablename__}: {e}")
+        return {"error": str(e)}
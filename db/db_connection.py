@@ -1,9 +1,13 @@
 from sqlalchemy import create_engine, engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import sqlalchemy
+import asyncio
+import asyncpg
 import pg8000
-import os, sys
-from google.cloud.sql.connector import Connector, IPTypes
+import os, sys, time, threading
+from google.cloud.sql.connector import Connector, IPTypes, create_async_connector
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,6 +24,92 @@ db_host = os.environ.get("DB_HOST")
 unix_socket_path = os.environ.get("INSTANCE_UNIX_SOCKET")
 cloud_sql_instance = os.environ.get('CLOUD_SQL_INSTANCE')
 
+# Connection pool settings. The async engine gets its own pool of the same size.
+pool_size = int(os.environ.get("DB_POOL_SIZE", 5))
+pool_max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+pool_timeout = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Cloud SQL drops idle connections, so recycle well before that and ping on checkout
+pool_recycle = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+pool_pre_ping = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+pool_prewarm = int(os.environ.get("DB_POOL_PREWARM", 0))
+
+
+class PoolStats:
+    """Checkout counters for one pool class, shared by every pool it recreates."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_total * 1000, 3),
+                "wait_ms_avg": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
+
+class InstrumentedPoolMixin:
+    """Times how long each checkout waits for a free connection."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return conn
+
+    def status_dict(self) -> dict:
+        return {
+            "pool_size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            **self.stats.as_dict(),
+        }
+
+
+# Stats live on the class because SQLAlchemy rebuilds the pool object on dispose()
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def pool_options(poolclass) -> dict:
+    """Keyword arguments shared by every create_engine / create_async_engine call."""
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": pool_max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+
 def connect_with_connector() -> sqlalchemy.engine.base.Engine:
     """
     Initializes a connection pool for a Cloud SQL instance of Postgres.
@@ -52,7 +142,7 @@ def connect_with_connector() -> sqlalchemy.engine.base.Engine:
     pool = sqlalchemy.create_engine(
         "postgresql+pg8000://",
         creator=getconn,
-        # ...
+        **pool_options(InstrumentedQueuePool)
     )
     return pool
 
@@ -68,7 +158,59 @@ def connect_to_local_postgres() -> sqlalchemy.engine.base.Engine:
         db_port=db_port,
         db_name=db_name
     )
-    local_engine = sqlalchemy.create_engine(local_db_url)
+    local_engine = sqlalchemy.create_engine(local_db_url, **pool_options(InstrumentedQueuePool))
+    return local_engine
+
+
+# The async connector has to be created inside the running event loop, so it is
+# built lazily by the first connection request and shared afterwards.
+async_connector = None
+async_connector_lock = asyncio.Lock()
+
+def connect_with_async_connector() -> AsyncEngine:
+    """
+    Initializes an async connection pool for a Cloud SQL instance of Postgres.
+
+    Uses the Cloud SQL Python Connector package with the asyncpg driver.
+    """
+    ip_type = IPTypes.PRIVATE if os.environ.get("PRIVATE_IP") else IPTypes.PUBLIC
+
+    async def getconn() -> asyncpg.Connection:
+        global async_connector
+        async with async_connector_lock:
+            if async_connector is None:
+                async_connector = await create_async_connector(refresh_strategy="LAZY")
+        conn: asyncpg.Connection = await async_connector.connect_async(
+            cloud_sql_instance,
+            "asyncpg",
+            user=db_user,
+            password=db_pass,
+            db=db_name,
+            ip_type=ip_type,
+        )
+        return conn
+
+    # 'async_creator' is the asyncio counterpart of the 'creator' argument
+    pool = create_async_engine(
+        "postgresql+asyncpg://",
+        async_creator=getconn,
+        **pool_options(InstrumentedAsyncQueuePool)
+    )
+    return pool
+
+
+def connect_to_local_postgres_async() -> AsyncEngine:
+    """
+    Initializes an async connection pool for a local instance of Postgres.
+    """
+    local_db_url = "postgresql+asyncpg://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}".format(
+        db_user=db_user,
+        db_pass=db_pass,
+        db_host=db_host,
+        db_port=db_port,
+        db_name=db_name
+    )
+    local_engine = create_async_engine(local_db_url, **pool_options(InstrumentedAsyncQueuePool))
     return local_engine
 
 # Example usage
@@ -76,6 +218,11 @@ dbengine = connect_to_local_postgres() if os.getenv('DEV') else connect_with_con
 SessionLocal = sessionmaker(bind=dbengine)
 Base = declarative_base()
 
+# Async engine used by the async routes. Objects stay usable after commit so
+# they can be serialized without another round trip.
+async_dbengine = connect_to_local_postgres_async() if os.getenv('DEV') else connect_with_async_connector()
+AsyncSessionLocal = async_sessionmaker(bind=async_dbengine, expire_on_commit=False)
+
 # Create tables automatically when the module is imported
 def init_table():
     """Ensures all tables are created before the app starts."""
@@ -84,6 +231,42 @@ def init_table():
     # Base.metadata.create_all(engine)  # Creates all tables again
 
 
+def prewarm_pool(count: int = pool_prewarm):
+    """Opens `count` connections up front so the first requests skip the connect cost."""
+    count = min(count, pool_size + pool_max_overflow)
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(dbengine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
+    if count:
+        print(f"Pre-warmed {len(connections)} database connections")
+
+
+async def prewarm_async_pool(count: int = pool_prewarm):
+    """Async counterpart of prewarm_pool for the async engine."""
+    count = min(count, pool_size + pool_max_overflow)
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(await async_dbengine.connect())
+    finally:
+        for conn in connections:
+            await conn.close()
+    if count:
+        print(f"Pre-warmed {len(connections)} async database connections")
+
+
+def pool_stats() -> dict:
+    """Current pool usage for both engines, for scraping."""
+    return {
+        "sync": dbengine.pool.status_dict(),
+        "async": async_dbengine.pool.status_dict(),
+    }
+
+
 # Function to get a database session
 def get_db():
     """Provides a new session instance."""
@@ -92,6 +275,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Function to get an async database session
+async def get_async_db():
+    """Provides a new async session instance."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def close_async_db():
+    """Disposes the async pool and closes the Cloud SQL connector, if any."""
+    global async_connector
+    await async_dbengine.dispose()
+    if async_connector is not None:
+        await async_connector.close_async()
+        async_connector = None
         
         
 if __name__ == '__main__':
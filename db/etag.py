@@ -0,0 +1,89 @@
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, text, table, column
+from db.db_connection import dbengine
+import hashlib
+
+# Weak ETags built from row versions (the trigger-maintained updated_at
+# columns). A version is the latest updated_at plus the row count of the rows a
+# response is built from, so inserts, updates and deletes all change it, and
+# checking it is one small query instead of rebuilding the payload.
+#
+# Responses built from whole tables use a version sequence per table instead,
+# bumped by a trigger when a writing transaction commits, so reading them is a
+# few sequence lookups rather than a scan, and writers never wait on each other.
+
+# Tables with a version sequence
+VERSIONED_TABLES = ("users", "employers", "employer_jobs", "user_employer_jobs")
+
+# Migrations creating the updated_at triggers and the version sequences
+ETAG_MIGRATIONS = {10, 14}
+
+
+def version_sequence(table_name: str) -> str:
+    return f"kopipes_{table_name}_version"
+
+# Set by check_etag_support() at startup. Without the triggers a version would
+# not change on writes and clients would get 304s for stale data, so routes
+# send no ETag until then.
+etags_enabled = False
+
+
+def check_etag_support(engine=dbengine) -> bool:
+    """Enables ETags when the migrations behind the row versions are applied."""
+    global etags_enabled
+    try:
+        with engine.connect() as conn:
+            applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    except Exception as e:
+        print(f"Error reading schema_migrations, ETags disabled: {e}")
+        applied = set()
+    etags_enabled = ETAG_MIGRATIONS <= applied
+    if not etags_enabled:
+        print(f"ETags disabled until migrations {sorted(ETAG_MIGRATIONS - applied)} are applied")
+    return etags_enabled
+
+
+def etags_available() -> bool:
+    return etags_enabled
+
+
+def fetch_table_versions(session: Session, tables) -> tuple:
+    """Versions of `tables`, in order, in one query."""
+    return tuple(session.execute(select(*[
+        select(column("last_value")).select_from(table(version_sequence(name))).scalar_subquery()
+        for name in tables
+    ])).one())
+
+
+def row_version(model, *criteria) -> list:
+    """Latest updated_at and row count of `model` rows matching `criteria`, as scalar subqueries."""
+    return [
+        select(func.max(model.updated_at)).where(*criteria).scalar_subquery(),
+        select(func.count()).select_from(model).where(*criteria).scalar_subquery(),
+    ]
+
+
+def fetch_versions(session: Session, versions: list, *criteria):
+    """Runs all `versions` in a single SELECT. None when `criteria` match no row."""
+    row = session.execute(select(*versions).where(*criteria)).first()
+    return tuple(row) if row else None
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match header, which may list several tags."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -1,23 +1,519 @@
-from db_connection import SessionLocal
-from crud import add_columns_to_table
-
-# Get a session
-session = SessionLocal()
-
-# Modify table
-add_columns_to_table(session, "users", {
-    # "resume": "TEXT"
-    # "resume_base64": "TEXT"
-    "position": "TEXT",
-    "location": "TEXT",
-    "experience": "TEXT",
-    "education": "TEXT",
-    "jobs": "TEXT"
-})
-
-# add_columns_to_table(session, "skill_assess", {
-#     "level": "TEXT"
-# })
-
-# Close session
-session.close()
\ No newline at end of file
+"""
+Versioned schema migrations.
+
+Each migration runs once and is recorded in the schema_migrations table.
+Plain migrations run in a single transaction. Migrations marked
+"concurrently" run statement by statement in autocommit mode, which
+CREATE INDEX CONCURRENTLY needs, so index builds do not block writes.
+
+Run from the root folder:
+
+    python3 -m db.migrations          # create missing tables, apply pending migrations
+    python3 -m db.migrations status   # list applied / pending migrations
+
+Deploys run them as a Cloud Run job before the new revision takes traffic
+(.github/workflows/deploy.yml); the app only checks that none are pending.
+"""
+from sqlalchemy import text
+import re, sys, time
+from db.db_connection import dbengine
+from db.models.employer import JOB_SEARCH_VECTOR
+from db.etag import VERSIONED_TABLES, version_sequence
+
+MIGRATIONS = [
+    {
+        "version": 1,
+        "name": "profile and job detail columns",
+        "statements": [
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS position TEXT",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS location TEXT",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS experience TEXT",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS education TEXT",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS jobs TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS summary TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS responsibilities TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS qualifications TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS skills TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS experience TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS experienceyear TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS postedtime TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS jobtype TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS workmode TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS level TEXT",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS location TEXT",
+            "ALTER TABLE employers ADD COLUMN IF NOT EXISTS location TEXT",
+            "ALTER TABLE employers ADD COLUMN IF NOT EXISTS businessnature TEXT",
+        ],
+    },
+    {
+        "version": 2,
+        "name": "remove duplicate skills and applications",
+        # keep the most recent row so the unique indexes below can be built
+        "statements": [
+            """
+            DELETE FROM users_skills a USING users_skills b
+            WHERE a.user_id = b.user_id AND a.name = b.name AND a.id < b.id
+            """,
+            """
+            DELETE FROM user_employer_jobs a USING user_employer_jobs b
+            WHERE a.user_id = b.user_id AND a.employer_jobs_id = b.employer_jobs_id AND a.id < b.id
+            """,
+        ],
+    },
+    {
+        "version": 3,
+        "name": "indexes for per-user and per-employer lookups",
+        "concurrently": True,
+        "statements": [
+            # also serves users_skills.user_id lookups through its leading column
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_users_skills_user_id_name ON users_skills (user_id, name)",
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_user_employer_jobs_user_id_job_id ON user_employer_jobs (user_id, employer_jobs_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_employer_jobs_employer_jobs_id ON user_employer_jobs (employer_jobs_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_skill_assess_user_id ON users_skill_assess (user_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employer_jobs_employer_id ON employer_jobs (employer_id)",
+        ],
+    },
+    {
+        "version": 4,
+        "name": "unique user email",
+        # fails if two accounts already share an email; merge them and re-run
+        "concurrently": True,
+        "statements": [
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_users_email ON users (email)",
+        ],
+    },
+    {
+        "version": 5,
+        "name": "JSON text columns to JSONB",
+        # Rewrites the tables. Blank values become NULL and text that is not
+        # valid JSON is kept as a JSON string rather than failing the migration.
+        "statements": [
+            """
+            CREATE OR REPLACE FUNCTION kopipes_try_jsonb(value TEXT) RETURNS JSONB AS $$
+            BEGIN
+                IF value IS NULL OR btrim(value) = '' THEN
+                    RETURN NULL;
+                END IF;
+                RETURN value::jsonb;
+            EXCEPTION WHEN others THEN
+                RETURN to_jsonb(value);
+            END;
+            $$ LANGUAGE plpgsql IMMUTABLE
+            """,
+            "ALTER TABLE user_employer_jobs ALTER COLUMN match_json DROP DEFAULT",
+            "ALTER TABLE user_employer_jobs ALTER COLUMN match_json TYPE JSONB USING kopipes_try_jsonb(match_json::text)",
+            "ALTER TABLE employer_jobs ALTER COLUMN desc_json TYPE JSONB USING kopipes_try_jsonb(desc_json::text)",
+            "ALTER TABLE employer_jobs ALTER COLUMN responsibilities TYPE JSONB USING kopipes_try_jsonb(responsibilities::text)",
+            "ALTER TABLE employer_jobs ALTER COLUMN skills TYPE JSONB USING kopipes_try_jsonb(skills::text)",
+            "ALTER TABLE users ALTER COLUMN about TYPE JSONB USING kopipes_try_jsonb(about::text)",
+            "ALTER TABLE users ALTER COLUMN jobs TYPE JSONB USING kopipes_try_jsonb(jobs::text)",
+            "ALTER TABLE users ALTER COLUMN experience TYPE JSONB USING kopipes_try_jsonb(experience::text)",
+            "ALTER TABLE users ALTER COLUMN education TYPE JSONB USING kopipes_try_jsonb(education::text)",
+            "ALTER TABLE users ALTER COLUMN resume_base64 TYPE JSONB USING kopipes_try_jsonb(resume_base64::text)",
+        ],
+    },
+    {
+        "version": 6,
+        "name": "GIN index for job skills containment",
+        "concurrently": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employer_jobs_skills ON employer_jobs USING gin (skills jsonb_path_ops)",
+        ],
+    },
+    {
+        "version": 7,
+        "name": "weighted full-text search vector for jobs",
+        # stored generated column, so Postgres keeps it current on every insert/update
+        "statements": [
+            f"""
+            ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS ({JOB_SEARCH_VECTOR}) STORED
+            """,
+        ],
+    },
+    {
+        "version": 8,
+        "name": "GIN index for job full-text search",
+        "concurrently": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employer_jobs_search_vector ON employer_jobs USING gin (search_vector)",
+        ],
+    },
+    {
+        "version": 9,
+        "name": "denormalized job documents",
+        # One ready-to-serve JSON document per job with its employer embedded.
+        # Statement-level triggers rebuild the documents of every job touched
+        # by a write, in one pass per statement; deleting a job or employer
+        # cascades to its documents. Jobs without an employer have none.
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS job_documents (
+                id INTEGER PRIMARY KEY REFERENCES employer_jobs (id) ON DELETE CASCADE,
+                employer_id INTEGER NOT NULL,
+                doc JSONB NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_job_documents_employer_id ON job_documents (employer_id)",
+            """
+            CREATE OR REPLACE FUNCTION kopipes_refresh_job_documents(job_ids INTEGER[]) RETURNS void AS $$
+            BEGIN
+                DELETE FROM job_documents WHERE id = ANY(job_ids);
+                INSERT INTO job_documents (id, employer_id, doc)
+                SELECT j.id, e.id, jsonb_build_object(
+                    'id', j.id,
+                    'employer_id', e.id,
+                    'name', coalesce(j.name, ''),
+                    'description', coalesce(j.description, ''),
+                    'desc_json', coalesce(j.desc_json, '{}'::jsonb),
+                    'summary', coalesce(j.summary, ''),
+                    'responsibilities', coalesce(j.responsibilities, '[]'::jsonb),
+                    'qualifications', coalesce(j.qualifications, ''),
+                    'skills', coalesce(j.skills, '[]'::jsonb),
+                    'experience', coalesce(j.experience, ''),
+                    'experienceyear', coalesce(j.experienceyear, ''),
+                    'postedtime', coalesce(j.postedtime, ''),
+                    'jobtype', coalesce(j.jobtype, ''),
+                    'workmode', coalesce(j.workmode, ''),
+                    'level', coalesce(j.level, ''),
+                    'location', coalesce(j.location, ''),
+                    'employer', jsonb_build_object(
+                        'id', e.id,
+                        'name', coalesce(e.name, ''),
+                        'info', coalesce(e.info, ''),
+                        'logo', coalesce(e.logo, ''),
+                        'location', coalesce(e.location, ''),
+                        'businessnature', coalesce(e.businessnature, '')
+                    )
+                )
+                FROM employer_jobs j JOIN employers e ON e.id = j.employer_id
+                WHERE j.id = ANY(job_ids);
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE OR REPLACE FUNCTION kopipes_job_documents_jobs_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM kopipes_refresh_job_documents(ARRAY(SELECT id FROM changed_rows));
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE OR REPLACE FUNCTION kopipes_job_documents_employers_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM kopipes_refresh_job_documents(ARRAY(
+                    SELECT j.id FROM employer_jobs j JOIN changed_rows c ON c.id = j.employer_id
+                ));
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            # transition tables allow a single event per trigger
+            "DROP TRIGGER IF EXISTS job_documents_jobs_inserted ON employer_jobs",
+            """
+            CREATE TRIGGER job_documents_jobs_inserted AFTER INSERT ON employer_jobs
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION kopipes_job_documents_jobs_changed()
+            """,
+            "DROP TRIGGER IF EXISTS job_documents_jobs_updated ON employer_jobs",
+            """
+            CREATE TRIGGER job_documents_jobs_updated AFTER UPDATE ON employer_jobs
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION kopipes_job_documents_jobs_changed()
+            """,
+            "DROP TRIGGER IF EXISTS job_documents_employers_updated ON employers",
+            """
+            CREATE TRIGGER job_documents_employers_updated AFTER UPDATE ON employers
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION kopipes_job_documents_employers_changed()
+            """,
+            "SELECT kopipes_refresh_job_documents(ARRAY(SELECT id FROM employer_jobs))",
+        ],
+    },
+    {
+        "version": 10,
+        "name": "row versions for ETags",
+        # The trigger covers every write path (ORM, bulk upserts, raw SQL).
+        # clock_timestamp rather than now() so rows written later in a long
+        # transaction still get a newer version.
+        "statements": [
+            """
+            CREATE OR REPLACE FUNCTION kopipes_touch_updated_at() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_at = clock_timestamp();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS users_touch_updated_at ON users",
+            "CREATE TRIGGER users_touch_updated_at BEFORE UPDATE ON users FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+            "ALTER TABLE users_skills ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS users_skills_touch_updated_at ON users_skills",
+            "CREATE TRIGGER users_skills_touch_updated_at BEFORE UPDATE ON users_skills FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+            "ALTER TABLE users_skill_assess ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS users_skill_assess_touch_updated_at ON users_skill_assess",
+            "CREATE TRIGGER users_skill_assess_touch_updated_at BEFORE UPDATE ON users_skill_assess FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+            "ALTER TABLE user_employer_jobs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS user_employer_jobs_touch_updated_at ON user_employer_jobs",
+            "CREATE TRIGGER user_employer_jobs_touch_updated_at BEFORE UPDATE ON user_employer_jobs FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+            "ALTER TABLE employers ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS employers_touch_updated_at ON employers",
+            "CREATE TRIGGER employers_touch_updated_at BEFORE UPDATE ON employers FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+            "ALTER TABLE employer_jobs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            "DROP TRIGGER IF EXISTS employer_jobs_touch_updated_at ON employer_jobs",
+            "CREATE TRIGGER employer_jobs_touch_updated_at BEFORE UPDATE ON employer_jobs FOR EACH ROW EXECUTE FUNCTION kopipes_touch_updated_at()",
+        ],
+    },
+    {
+        "version": 11,
+        "name": "indexes for latest row version lookups",
+        "concurrently": True,
+        "statements": [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_updated_at ON users (updated_at)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_employer_jobs_updated_at ON user_employer_jobs (updated_at)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employers_updated_at ON employers (updated_at)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employer_jobs_updated_at ON employer_jobs (updated_at)",
+        ],
+    },
+    {
+        "version": 12,
+        "name": "upsert job documents",
+        # Deleting and re-inserting the documents raced under READ COMMITTED:
+        # two transactions refreshing the same job could both delete, and the
+        # second insert then failed on the primary key. Upserting is safe, and
+        # only documents whose job (or its employer) is gone are deleted.
+        "statements": [
+            """
+            CREATE OR REPLACE FUNCTION kopipes_refresh_job_documents(job_ids INTEGER[]) RETURNS void AS $$
+            BEGIN
+                INSERT INTO job_documents (id, employer_id, doc)
+                SELECT j.id, e.id, jsonb_build_object(
+                    'id', j.id,
+                    'employer_id', e.id,
+                    'name', coalesce(j.name, ''),
+                    'description', coalesce(j.description, ''),
+                    'desc_json', coalesce(j.desc_json, '{}'::jsonb),
+                    'summary', coalesce(j.summary, ''),
+                    'responsibilities', coalesce(j.responsibilities, '[]'::jsonb),
+                    'qualifications', coalesce(j.qualifications, ''),
+                    'skills', coalesce(j.skills, '[]'::jsonb),
+                    'experience', coalesce(j.experience, ''),
+                    'experienceyear', coalesce(j.experienceyear, ''),
+                    'postedtime', coalesce(j.postedtime, ''),
+                    'jobtype', coalesce(j.jobtype, ''),
+                    'workmode', coalesce(j.workmode, ''),
+                    'level', coalesce(j.level, ''),
+                    'location', coalesce(j.location, ''),
+                    'employer', jsonb_build_object(
+                        'id', e.id,
+                        'name', coalesce(e.name, ''),
+                        'info', coalesce(e.info, ''),
+                        'logo', coalesce(e.logo, ''),
+                        'location', coalesce(e.location, ''),
+                        'businessnature', coalesce(e.businessnature, '')
+                    )
+                )
+                FROM employer_jobs j JOIN employers e ON e.id = j.employer_id
+                WHERE j.id = ANY(job_ids)
+                ON CONFLICT (id) DO UPDATE SET employer_id = EXCLUDED.employer_id, doc = EXCLUDED.doc;
+
+                DELETE FROM job_documents d
+                WHERE d.id = ANY(job_ids) AND NOT EXISTS (
+                    SELECT 1 FROM employer_jobs j JOIN employers e ON e.id = j.employer_id WHERE j.id = d.id
+                );
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+        ],
+    },
+    {
+        "version": 13,
+        "name": "table version counters for ETags",
+        # One counter per table, bumped by a statement trigger in the writing
+        # transaction, so readers never see a new version before the data.
+        # Listing ETags read these instead of scanning the tables.
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT INTO table_versions (table_name) VALUES "
+            + ", ".join(f"('{name}')" for name in VERSIONED_TABLES)
+            + " ON CONFLICT (table_name) DO NOTHING",
+            """
+            CREATE OR REPLACE FUNCTION kopipes_bump_table_version() RETURNS trigger AS $$
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            *[
+                statement
+                for name in VERSIONED_TABLES
+                for statement in (
+                    f"DROP TRIGGER IF EXISTS {name}_bump_table_version ON {name}",
+                    f"""
+                    CREATE TRIGGER {name}_bump_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {name}
+                    FOR EACH STATEMENT EXECUTE FUNCTION kopipes_bump_table_version()
+                    """,
+                )
+            ],
+        ],
+    },
+    {
+        "version": 14,
+        "name": "table version sequences for ETags",
+        # Replaces the table_versions counters of migration 13: every writer of
+        # a table took its counter's row lock until commit, serializing writers
+        # and risking deadlocks between transactions writing two tables. A
+        # sequence per table is bumped instead. nextval() never blocks, but it
+        # is not transactional either, so it runs from a deferred trigger at
+        # commit: a reader only sees the new version once the writer commits.
+        "statements": [
+            *[f"DROP TRIGGER IF EXISTS {name}_bump_table_version ON {name}" for name in VERSIONED_TABLES],
+            "DROP FUNCTION IF EXISTS kopipes_bump_table_version()",
+            "DROP TABLE IF EXISTS table_versions",
+            """
+            CREATE OR REPLACE FUNCTION kopipes_bump_version() RETURNS trigger AS $$
+            BEGIN
+                PERFORM nextval(TG_ARGV[0]::regclass);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            *[
+                statement
+                for name in VERSIONED_TABLES
+                for statement in (
+                    f"CREATE SEQUENCE IF NOT EXISTS {version_sequence(name)}",
+                    # last_value of a new sequence does not change on its first nextval()
+                    f"SELECT nextval('{version_sequence(name)}')",
+                    f"DROP TRIGGER IF EXISTS {name}_bump_version ON {name}",
+                    f"""
+                    CREATE CONSTRAINT TRIGGER {name}_bump_version AFTER INSERT OR UPDATE OR DELETE ON {name}
+                    DEFERRABLE INITIALLY DEFERRED
+                    FOR EACH ROW EXECUTE FUNCTION kopipes_bump_version('{version_sequence(name)}')
+                    """,
+                    f"DROP TRIGGER IF EXISTS {name}_bump_version_truncated ON {name}",
+                    f"""
+                    CREATE TRIGGER {name}_bump_version_truncated AFTER TRUNCATE ON {name}
+                    FOR EACH STATEMENT EXECUTE FUNCTION kopipes_bump_version('{version_sequence(name)}')
+                    """,
+                )
+            ],
+        ],
+    },
+]
+
+# Any constant works, it only has to be the same for every instance
+MIGRATION_LOCK_ID = 7351001
+
+CONCURRENT_INDEX_NAME = re.compile(r"INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+def ensure_migration_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            duration_ms INTEGER
+        )
+    """))
+
+
+def applied_versions(conn) -> set:
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def record_migration(conn, migration: dict, duration_ms: int):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (:version, :name, :duration_ms)"),
+        {"version": migration["version"], "name": migration["name"], "duration_ms": duration_ms}
+    )
+
+
+def drop_invalid_index(conn, index_name: str):
+    """A failed CREATE INDEX CONCURRENTLY leaves an INVALID index that IF NOT EXISTS would skip."""
+    invalid = conn.execute(text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name AND NOT i.indisvalid
+    """), {"name": index_name}).first()
+    if invalid:
+        print(f"Dropping invalid index {index_name} left by an earlier failed build")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+
+def apply_migration(engine, migration: dict):
+    start = time.perf_counter()
+    if migration.get("concurrently"):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in migration["statements"]:
+                index_name = CONCURRENT_INDEX_NAME.search(statement)
+                if index_name:
+                    drop_invalid_index(conn, index_name.group(1))
+                conn.execute(text(statement))
+            record_migration(conn, migration, int((time.perf_counter() - start) * 1000))
+    else:
+        with engine.begin() as conn:
+            for statement in migration["statements"]:
+                conn.execute(text(statement))
+            record_migration(conn, migration, int((time.perf_counter() - start) * 1000))
+
+
+def run_migrations(engine=dbengine) -> list:
+    """Applies pending migrations in order and returns the versions applied."""
+    applied = []
+    # The lock connection stays outside the migration transactions, so other
+    # instances wait here instead of racing on the same migration.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            ensure_migration_table(lock_conn)
+            done = applied_versions(lock_conn)
+            for migration in sorted(MIGRATIONS, key=lambda m: m["version"]):
+                if migration["version"] in done:
+                    continue
+                print(f"Applying migration {migration['version']}: {migration['name']}")
+                try:
+                    apply_migration(engine, migration)
+                except Exception as e:
+                    print(f"Migration {migration['version']} failed: {e}")
+                    raise
+                applied.append(migration["version"])
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    return applied
+
+
+def pending_migrations(engine=dbengine) -> list:
+    """Versions not applied yet."""
+    return [migration["version"] for migration in migration_status(engine) if not migration["applied"]]
+
+
+def migration_status(engine=dbengine) -> list:
+    with engine.begin() as conn:
+        ensure_migration_table(conn)
+        done = applied_versions(conn)
+    return [
+        {"version": m["version"], "name": m["name"], "applied": m["version"] in done}
+        for m in sorted(MIGRATIONS, key=lambda m: m["version"])
+    ]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        for migration in migration_status():
+            print(f"{migration['version']:>4}  {'applied' if migration['applied'] else 'pending':<8} {migration['name']}")
+    else:
+        # every model, so create_all also covers a fresh database
+        import db.models.user, db.models.employer, db.models.skill_assess, db.models.llm
+        from db.db_connection import init_table
+        init_table()
+        run_migrations()
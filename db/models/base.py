@@ -0,0 +1,74 @@
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, model_validator
+from sqlalchemy import inspect
+from typing import Generic, List, Optional, TypeVar
+import re, threading, time
+
+class ORMSchema(BaseModel):
+    """
+    Response model read from an ORM object. Only attributes the query already
+    loaded are read; unloaded relationships and deferred columns are left
+    unset (and dropped from the output) instead of being loaded, so
+    serializing never runs SQL and stays bounded by the loading profile.
+    """
+    model_config = ConfigDict(from_attributes=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def loaded_attributes(cls, data):
+        state = inspect(data, raiseerr=False)
+        if state is None or not hasattr(state, "unloaded"):
+            return data
+        unloaded = state.unloaded
+        return {name: getattr(data, name) for name in cls.model_fields if name not in unloaded and hasattr(data, name)}
+
+T = TypeVar("T")
+
+# carries the next cursor of a list served without `limit`
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class Page(BaseModel, Generic[T]):
+    """One keyset page, see db.crud.page_result."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+# schema name -> {"count", "total_ms", "max_ms", "bytes"}, served at /metrics/serialization
+serialization_stats = {}
+serialization_lock = threading.Lock()
+
+adapters = {}
+
+def unpaged_response(schema, page: dict) -> Response:
+    """
+    A keyset page in the plain list shape (`schema` is List[...]), with its
+    next cursor, if any, in the X-Next-Cursor header.
+    """
+    response = model_response(schema, page["items"])
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return response
+
+def schema_name(schema) -> str:
+    return getattr(schema, "__name__", None) or re.sub(r"[\w.]+\.", "", str(schema))
+
+def model_response(schema, value) -> Response:
+    """
+    Validates `value` (ORM objects) against `schema` and dumps it straight to
+    JSON bytes with pydantic-core, skipping jsonable_encoder. Time and size are
+    recorded per schema.
+    """
+    adapter = adapters.get(schema)
+    if adapter is None:
+        adapter = adapters[schema] = TypeAdapter(schema)
+
+    start = time.perf_counter()
+    body = adapter.dump_json(adapter.validate_python(value, from_attributes=True), exclude_unset=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    with serialization_lock:
+        stats = serialization_stats.setdefault(schema_name(schema), {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes": 0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["bytes"] += len(body)
+    return Response(content=body, media_type="application/json")
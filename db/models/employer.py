@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table, Text, Index, Computed, DateTime, FetchedValue, func
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.orm.attributes import set_committed_value
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List, Any
+from datetime import datetime
 from db.db_connection import Base
+from db.models.base import ORMSchema
 # from db.models.user import UserEmployerJobs
 
 class EmployerSchema(BaseModel):
@@ -14,6 +18,7 @@ class EmployerSchema(BaseModel):
 
 class Employer(Base):
     __tablename__ = "employers"
+    __table_args__ = (Index("ix_employers_updated_at", "updated_at"),)
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=True)
@@ -21,22 +26,38 @@ class Employer(Base):
     logo = Column(String, nullable=True)
     location = Column(String, nullable=True)
     businessnature = Column(String, nullable=True)
+    # set by the database on every insert/update, see migration 10
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
     
-    jobs = relationship('EmployerJobs', back_populates='employer', lazy="joined")
+    jobs = relationship('EmployerJobs', back_populates='employer')
 
 
+# name ranks above summary, which ranks above description
+JOB_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(summary, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')"
+)
+
 class EmployerJobs(Base):
     __tablename__ = "employer_jobs"
+    __table_args__ = (
+        Index("ix_employer_jobs_employer_id", "employer_id"),
+        # serves skills @> '["Python"]' containment filters
+        Index("ix_employer_jobs_skills", "skills", postgresql_using="gin", postgresql_ops={"skills": "jsonb_path_ops"}),
+        Index("ix_employer_jobs_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_employer_jobs_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employer_id = Column(Integer, ForeignKey("employers.id", ondelete="CASCADE"))
     name = Column(String)
     description = Column(Text)
-    desc_json = Column(Text)
+    desc_json = Column(JSONB)
     summary = Column(Text)
-    responsibilities = Column(Text)
+    responsibilities = Column(JSONB)
     qualifications = Column(Text)
-    skills = Column(Text)
+    skills = Column(JSONB)
     experience = Column(Text)
     experienceyear = Column(String)
     postedtime = Column(String)
@@ -44,6 +65,71 @@ class EmployerJobs(Base):
     workmode = Column(String)
     level = Column(String)
     location = Column(String)
+    # Weighted full-text document kept up to date by Postgres on every write.
+    # Deferred so ordinary job queries never ship it.
+    search_vector = deferred(Column(TSVECTOR, Computed(JOB_SEARCH_VECTOR, persisted=True)))
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
+
+    employer = relationship("Employer", back_populates="jobs")
+    user_employer_jobs = relationship('UserEmployerJobs', back_populates='jobs', uselist=True)
+
+    def fill_json_defaults(self):
+        """Empty JSON fields as {} / [] for the client, without marking the row as changed."""
+        if not self.desc_json:
+            set_committed_value(self, "desc_json", {})
+        if not self.responsibilities:
+            set_committed_value(self, "responsibilities", [])
+        if not self.skills:
+            set_committed_value(self, "skills", [])
+
+
+class JobDocument(Base):
+    """
+    Pre-built JSON document of a job and its employer, as served by the job
+    listing routes. Written only by database triggers (migration 9).
+    """
+    __tablename__ = "job_documents"
+    __table_args__ = (
+        Index("ix_job_documents_employer_id", "employer_id"),
+    )
+
+    # same id as the job
+    id = Column(Integer, ForeignKey("employer_jobs.id", ondelete="CASCADE"), primary_key=True)
+    employer_id = Column(Integer, nullable=False)
+    doc = Column(JSONB, nullable=False)
+
+
+# Response models. Relationship fields are only filled when the loading
+# profile loaded them, see ORMSchema.
 
-    employer = relationship("Employer", back_populates="jobs", lazy='joined')
-    user_employer_jobs = relationship('UserEmployerJobs', back_populates='jobs', lazy='joined', uselist=True)
+class EmployerResponse(ORMSchema):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    info: Optional[str] = None
+    logo: Optional[str] = None
+    location: Optional[str] = None
+    businessnature: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    jobs: Optional[List["EmployerJobsResponse"]] = None
+
+class EmployerJobsResponse(ORMSchema):
+    id: Optional[int] = None
+    employer_id: Optional[int] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    desc_json: Optional[Any] = None
+    summary: Optional[str] = None
+    responsibilities: Optional[Any] = None
+    qualifications: Optional[str] = None
+    skills: Optional[Any] = None
+    experience: Optional[str] = None
+    experienceyear: Optional[str] = None
+    postedtime: Optional[str] = None
+    jobtype: Optional[str] = None
+    workmode: Optional[str] = None
+    level: Optional[str] = None
+    location: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    employer: Optional[EmployerResponse] = None
+    # completed in db.models.user, which defines UserEmployerJobsResponse
+    user_employer_jobs: Optional[List["UserEmployerJobsResponse"]] = None
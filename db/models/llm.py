@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Float, Index, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+from db.db_connection import Base
+
+class LLMResponse(Base):
+    """
+    Persistent tier of the LLM response cache, see routers.llm_cache. One row
+    per model + prompt version + rendered prompt, read until `expires_at`.
+    """
+    __tablename__ = "llm_responses"
+    __table_args__ = (
+        Index("ux_llm_responses_cache_key", "cache_key", unique=True),
+        Index("ix_llm_responses_expires_at", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), nullable=False)
+    evaluator = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    output = Column(JSONB, nullable=False)
+    # time the original call took, credited as saved on every hit
+    cost_ms = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
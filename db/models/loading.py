@@ -0,0 +1,69 @@
+from sqlalchemy.orm import selectinload, joinedload, raiseload, undefer_group
+from db.models.user import User, UserSkills, UserSkillAssess, UserEmployerJobs
+from db.models.employer import Employer, EmployerJobs
+
+# Relationships are lazy by default. Each route picks one of these named
+# profiles to say which part of the object graph it actually renders:
+#   minimal - columns only, touching any relationship raises
+#   listing - what a list row shows
+#   profile - the full detail page
+# raiseload("*") makes accidental lazy loads (and N+1s) fail loudly instead of
+# silently running one query per row. The large User documents (the "details"
+# column group) are deferred the same way and only profiles that render a user
+# in full undefer them.
+USER_DETAILS = "details"
+LOAD_PROFILES = {
+    User: {
+        "minimal": lambda: [raiseload("*")],
+        "listing": lambda: [selectinload(User.skills), raiseload("*")],
+        "profile": lambda: [
+            undefer_group(USER_DETAILS),
+            selectinload(User.skills),
+            selectinload(User.skill_assess),
+            selectinload(User.employer_jobs).joinedload(UserEmployerJobs.jobs),
+            raiseload("*"),
+        ],
+    },
+    Employer: {
+        "minimal": lambda: [raiseload("*")],
+        "listing": lambda: [selectinload(Employer.jobs), raiseload("*")],
+        "profile": lambda: [
+            selectinload(Employer.jobs)
+                .selectinload(EmployerJobs.user_employer_jobs)
+                .joinedload(UserEmployerJobs.user)
+                .undefer_group(USER_DETAILS),
+            raiseload("*"),
+        ],
+    },
+    EmployerJobs: {
+        "minimal": lambda: [raiseload("*")],
+        "listing": lambda: [joinedload(EmployerJobs.employer, innerjoin=True), raiseload("*")],
+        "profile": lambda: [
+            joinedload(EmployerJobs.employer, innerjoin=True),
+            selectinload(EmployerJobs.user_employer_jobs).joinedload(UserEmployerJobs.user).undefer_group(USER_DETAILS),
+            raiseload("*"),
+        ],
+    },
+    UserEmployerJobs: {
+        "minimal": lambda: [raiseload("*")],
+        "listing": lambda: [joinedload(UserEmployerJobs.user), raiseload("*")],
+        "profile": lambda: [
+            joinedload(UserEmployerJobs.user).undefer_group(USER_DETAILS),
+            joinedload(UserEmployerJobs.jobs).joinedload(EmployerJobs.employer),
+            raiseload("*"),
+        ],
+    },
+    UserSkills: {
+        "minimal": lambda: [raiseload("*")],
+    },
+    UserSkillAssess: {
+        "minimal": lambda: [raiseload("*")],
+    },
+}
+
+def load_profile(model, name: str) -> list:
+    """Loader options for `model` under the named profile."""
+    try:
+        return LOAD_PROFILES[model][name]()
+    except KeyError:
+        raise ValueError(f"No '{name}' loading profile for {model.__name__}")
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table, Index, DateTime, FetchedValue, func, Text, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship, deferred
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Any
+from datetime import datetime
+import json
 from db.db_connection import Base
-from db.models.employer import EmployerJobs
+from db.models.base import ORMSchema
+from db.models.employer import EmployerJobs, EmployerResponse, EmployerJobsResponse
 
 class UserRegister(BaseModel):
     email: EmailStr
@@ -15,19 +19,33 @@ class UserLogin(BaseModel):
 class UserSchema(BaseModel):
     name: Optional[str] = None
     type: Optional[str] = None
-    about: Optional[str] = None
+    about: Optional[Any] = None
     resume: Optional[str] = None
     skills: Optional[Dict[str, str]] = None
     position: Optional[str] = None
     location: Optional[str] = None
-    experience: Optional[str] = None
-    education: Optional[str] = None
-    jobs: Optional[str] = None
+    experience: Optional[Any] = None
+    education: Optional[Any] = None
+    jobs: Optional[Any] = None
 
     def dict_without_none(self):
         """Return dictionary excluding None values."""
         return {key: value for key, value in self.dict(exclude_unset=True).items() if value is not None}
 
+    def dict_for_update(self):
+        """
+        Like dict_without_none, but JSON text sent for a JSONB field is decoded
+        first so it is stored as a structure rather than as a JSON string.
+        """
+        data = self.dict_without_none()
+        for key in ("about", "experience", "education", "jobs"):
+            if isinstance(data.get(key), str):
+                try:
+                    data[key] = json.loads(data[key])
+                except json.JSONDecodeError:
+                    pass
+        return data
+
 class ResumeReport(BaseModel):
     name: str = Field(description="Name of the employee")
     address: str = Field(description="Address of the employee")
@@ -45,33 +63,45 @@ class JobReport(BaseModel):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ux_users_email", "email", unique=True),
+        Index("ix_users_updated_at", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=True)
     email = Column(String, nullable=True)
     password = Column(String, nullable=True)
     type = Column(String, default="Pending")
-    about = Column(String, nullable=True)
+    # The large JSON documents (the resume extraction and the behavioral
+    # evaluation) are the "details" group: only loading profiles that render
+    # them undefer it, and touching them without it raises.
+    about = deferred(Column(JSONB, nullable=True), group="details", raiseload=True)
     resume = Column(String, nullable=True)
-    resume_base64 = Column(String, nullable=True)
+    resume_base64 = deferred(Column(JSONB, nullable=True), group="details", raiseload=True)
     position = Column(String, nullable=True)
     location = Column(String, nullable=True)
-    experience = Column(String, nullable=True)
-    education = Column(String, nullable=True)
-    jobs = Column(String, nullable=True)
+    experience = deferred(Column(JSONB, nullable=True), group="details", raiseload=True)
+    education = deferred(Column(JSONB, nullable=True), group="details", raiseload=True)
+    jobs = deferred(Column(JSONB, nullable=True), group="details", raiseload=True)
+    # set by the database on every insert/update, see migration 10
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
 
-    skills = relationship('UserSkills', back_populates='user', lazy="joined")
-    skill_assess = relationship('UserSkillAssess', back_populates='user', lazy="joined")
-    employer_jobs = relationship('UserEmployerJobs', back_populates='user', lazy='joined')
+    skills = relationship('UserSkills', back_populates='user')
+    skill_assess = relationship('UserSkillAssess', back_populates='user')
+    employer_jobs = relationship('UserEmployerJobs', back_populates='user')
 
 
 class UserSkills(Base):
     __tablename__ = "users_skills"
+    # one row per skill per user, also the ON CONFLICT target for skill upserts
+    __table_args__ = (Index("ux_users_skills_user_id_name", "user_id", "name", unique=True),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     name = Column(String, nullable=True)
     level = Column(String, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
 
     user = relationship('User', back_populates='skills')
 
@@ -88,6 +118,7 @@ class UserSkillAssessSchema(BaseModel):
 
 class UserSkillAssess(Base):
     __tablename__ = "users_skill_assess"
+    __table_args__ = (Index("ix_users_skill_assess_user_id", "user_id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
@@ -99,16 +130,133 @@ class UserSkillAssess(Base):
     answer_real = Column(String, nullable=True, default="")
     qs_level = Column(String, default="0")
     user_level = Column(String, default="0")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
 
     user = relationship('User', back_populates='skill_assess')
 
 class UserEmployerJobs(Base):
     __tablename__ = "user_employer_jobs"
+    # one application per user per job
+    __table_args__ = (
+        Index("ux_user_employer_jobs_user_id_job_id", "user_id", "employer_jobs_id", unique=True),
+        Index("ix_user_employer_jobs_employer_jobs_id", "employer_jobs_id"),
+        Index("ix_user_employer_jobs_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     employer_jobs_id = Column(Integer, ForeignKey('employer_jobs.id'), nullable=True)
-    match_json = Column(String, default="")
+    match_json = Column(JSONB, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), server_onupdate=FetchedValue())
+
+    user = relationship('User', back_populates="employer_jobs")
+    jobs = relationship('EmployerJobs', back_populates='user_employer_jobs')
+
+
+class ResumeJob(Base):
+    """
+    A resume uploaded with background=true, processed by routers.resume_pipeline.
+    status moves queued -> parsing -> parsed -> extracted -> skills_saved -> done,
+    or ends in failed with `error` set.
+    """
+    __tablename__ = "resume_jobs"
+    __table_args__ = (Index("ix_resume_jobs_status", "status"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    filename = Column(String, nullable=True)
+    # the uploaded file, cleared once the job is done; deferred so polling never loads it
+    pdf = deferred(Column(LargeBinary, nullable=True))
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    progress = Column(JSONB, nullable=True)
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class ResumeExtraction(Base):
+    """
+    Structured extraction of a resume, keyed on the SHA-256 of the uploaded
+    file and the prompt version and model that produced it, see
+    routers.resume_evaluator.cached_extraction.
+    """
+    __tablename__ = "resume_extractions"
+    __table_args__ = (
+        Index("ux_resume_extractions_key", "content_hash", "prompt_version", "model", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), nullable=False)
+    prompt_version = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    result = Column(JSONB, nullable=False)
+    # parse + LLM time of the original extraction, credited as saved on every hit
+    cost_ms = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Response models, see ORMSchema
+
+class UserSkillsResponse(ORMSchema):
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    name: Optional[str] = None
+    level: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class UserSkillAssessResponse(ORMSchema):
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    version: Optional[int] = None
+    qs_type: Optional[str] = None
+    question: Optional[str] = None
+    option: Optional[str] = None
+    answer_given: Optional[str] = None
+    answer_real: Optional[str] = None
+    qs_level: Optional[str] = None
+    user_level: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class UserResponse(ORMSchema):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    type: Optional[str] = None
+    about: Optional[Any] = None
+    resume: Optional[str] = None
+    resume_base64: Optional[Any] = None
+    position: Optional[str] = None
+    location: Optional[str] = None
+    experience: Optional[Any] = None
+    education: Optional[Any] = None
+    jobs: Optional[Any] = None
+    updated_at: Optional[datetime] = None
+    skills: Optional[List[UserSkillsResponse]] = None
+    skill_assess: Optional[List[UserSkillAssessResponse]] = None
+    employer_jobs: Optional[List["UserEmployerJobsResponse"]] = None
+
+class UserEmployerJobsResponse(ORMSchema):
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    employer_jobs_id: Optional[int] = None
+    match_json: Optional[Any] = None
+    updated_at: Optional[datetime] = None
+    user: Optional[UserResponse] = None
+    jobs: Optional[EmployerJobsResponse] = None
+
+class ResumeJobResponse(ORMSchema):
+    id: Optional[int] = None
+    status: Optional[str] = None
+    filename: Optional[str] = None
+    attempts: Optional[int] = None
+    progress: Optional[Any] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
-    user = relationship('User', back_populates="employer_jobs", lazy='joined')
-    jobs = relationship('EmployerJobs', back_populates='user_employer_jobs', lazy='joined')
\ No newline at end of file
+UserResponse.model_rebuild()
+EmployerJobsResponse.model_rebuild(_types_namespace={"UserEmployerJobsResponse": UserEmployerJobsResponse})
+EmployerResponse.model_rebuild(_types_namespace={"EmployerJobsResponse": EmployerJobsResponse})
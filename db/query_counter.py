@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import functools, os
+
+# Statements executed in the current request/task, when counting is active
+executed_statements = ContextVar("executed_statements", default=None)
+
+# Over-budget routes raise instead of only logging, meant for DEV and CI
+strict_query_budget = bool(os.getenv("DB_QUERY_BUDGET_STRICT"))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    statements = executed_statements.get()
+    if statements is not None:
+        statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Collects every SQL statement run inside the block (sync and async engines)."""
+    statements = []
+    token = executed_statements.set(statements)
+    try:
+        yield statements
+    finally:
+        executed_statements.reset(token)
+
+
+def query_budget(max_queries: int):
+    """
+    Route decorator that checks a sync handler runs at most `max_queries`
+    statements, whatever the page size.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with count_queries() as statements:
+                result = func(*args, **kwargs)
+            if len(statements) > max_queries:
+                message = f"{func.__name__} ran {len(statements)} queries, budget is {max_queries}"
+                if strict_query_budget:
+                    raise AssertionError(message)
+                print(f"Warning: {message}")
+            return result
+        return wrapper
+    return decorator
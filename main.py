@@ -1,18 +1,55 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from db.db_connection import init_table
-from routers import user, skill_assess, employer, seed, job_listing  # Remove product_router as it doesn't exist
-import uvicorn
+from db.db_connection import init_table, close_async_db, prewarm_pool, prewarm_async_pool
+from db.migrations import run_migrations, pending_migrations
+from db.etag import check_etag_support
+from routers import user, skill_assess, employer, seed, job_listing, metrics  # Remove product_router as it doesn't exist
+from routers.resume_evaluator import start_pdf_pool, shutdown_pdf_pool
+from routers.resume_pipeline import start_resume_workers, stop_resume_workers
+from routers.evaluators import start_evaluators, close_evaluators
+import uvicorn, os
 
-init_table()
+def prepare_database():
+    init_table()
+    # Migrations rewrite tables and build indexes, so they run once per deploy
+    # (`python3 -m db.migrations`, see .github/workflows/deploy.yml) rather than
+    # on every cold start. DB_MIGRATE_ON_STARTUP=1 applies them here instead,
+    # for local development.
+    if os.getenv("DB_MIGRATE_ON_STARTUP") == "1":
+        run_migrations()
+    # job_documents and the ETag row versions are kept by migration triggers;
+    # without them listings would be empty and ETags stale, so do not serve
+    pending = pending_migrations()
+    if pending:
+        raise RuntimeError(f"Pending schema migrations {pending}, run `python3 -m db.migrations` first")
+    check_etag_support()
 
-app = FastAPI()
+# Startup work lives in the lifespan rather than at import time: the PDF pool
+# workers re-import the __main__ module and must not touch the database.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare_database()
+    # open DB_POOL_PREWARM connections before taking traffic
+    prewarm_pool()
+    await prewarm_async_pool()
+    start_pdf_pool()
+    await start_evaluators()
+    await start_resume_workers()
+    yield
+    await stop_resume_workers()
+    shutdown_pdf_pool()
+    await close_evaluators()
+    await close_async_db()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods = ["*"],
-    allow_headers = ["*"]
+    allow_headers = ["*"],
+    expose_headers = ["X-Next-Cursor"]
 )
 
 #router
@@ -22,6 +59,7 @@ app.include_router(user.router, prefix="/users", tags=["users"])
 app.include_router(employer.router, prefix="/employer", tags=["employer"])
 app.include_router(job_listing.router, prefix="/jobs", tags=["jobs"])
 app.include_router(seed.router, prefix="/seed", tags=["seed"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
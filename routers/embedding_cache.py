@@ -0,0 +1,215 @@
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from collections import OrderedDict
+import numpy as np
+import asyncio, hashlib, os, sqlite3, threading, time
+
+# Cache of query embeddings, keyed on the embedding model and the SHA-256 of
+# the text. Recent vectors are kept as float32 arrays (3 KB for 768
+# dimensions) in an in-process LRU of EMBEDDING_CACHE_MAX_ENTRIES.
+#
+# With EMBEDDING_CACHE_PATH set, every vector is also written to a SQLite file
+# there so the cache survives restarts, trimmed to the
+# EMBEDDING_CACHE_DISK_MAX_ENTRIES most recently used. Point it at a mounted
+# volume: the container filesystem on Cloud Run is in memory and lost on
+# restart, so by default there is no file.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 4096))
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ENTRIES", 20000))
+
+# how many stored vectors between two trims of the file
+TRIM_EVERY = 256
+
+# Served at /metrics/embeddings
+embedding_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "batches": 0, "errors": 0, "embed_ms": 0.0}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingStore:
+    """SQLite table of float32 vectors, shared by the threads of this process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stored_since_trim = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+
+    def get_many(self, model: str, hashes: list) -> dict:
+        if not hashes:
+            return {}
+        placeholders = ",".join("?" * len(hashes))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *hashes]
+            ).fetchall()
+            if rows:
+                self.conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash IN ({','.join('?' * len(rows))})",
+                    [time.time(), model, *[row[0] for row in rows]]
+                )
+        return {row[0]: np.frombuffer(row[1], dtype=np.float32) for row in rows}
+
+    def put_many(self, model: str, vectors: dict):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()]
+            )
+            self.stored_since_trim += len(vectors)
+            if self.stored_since_trim >= TRIM_EVERY:
+                self.stored_since_trim = 0
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE last_used < ("
+                    "SELECT last_used FROM embeddings ORDER BY last_used DESC LIMIT 1 OFFSET ?)",
+                    [EMBEDDING_CACHE_DISK_MAX_ENTRIES]
+                )
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_store(path: str = EMBEDDING_CACHE_PATH):
+    if not path:
+        return None
+    try:
+        return EmbeddingStore(path)
+    except Exception as e:
+        print(f"Embedding cache file {path} unavailable, caching in memory only: {e}")
+        return None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings client and caches its query embeddings.
+    embed_queries() embeds every uncached text of a list in one batched call;
+    documents are passed through uncached.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore = None, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.store = store
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def from_memory(self, keys: list) -> dict:
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+        return found
+
+    def remember(self, vectors: dict):
+        with self.lock:
+            for key, vector in vectors.items():
+                self.memory[key] = np.asarray(vector, dtype=np.float32)
+                self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def embed_uncached(self, texts: list) -> list:
+        start = time.perf_counter()
+        if isinstance(self.embeddings, GoogleGenerativeAIEmbeddings):
+            # the same task type embed_query uses, so batched vectors match
+            vectors = self.embeddings.embed_documents(texts, task_type=self.embeddings.task_type or "RETRIEVAL_QUERY")
+        else:
+            vectors = [self.embeddings.embed_query(text) for text in texts]
+        embedding_stats["batches"] += 1
+        embedding_stats["embed_ms"] += (time.perf_counter() - start) * 1000
+        return vectors
+
+    def embed_queries(self, texts: list) -> list:
+        """Query embeddings for `texts`, in order. Blocking."""
+        keys = [text_hash(text) for text in texts]
+        found = self.from_memory(keys)
+        embedding_stats["memory_hits"] += len(found)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.store is not None:
+            try:
+                from_disk = self.store.get_many(self.model, missing)
+            except Exception as e:
+                embedding_stats["errors"] += 1
+                print(f"Error reading embedding cache: {e}")
+                from_disk = {}
+            embedding_stats["disk_hits"] += len(from_disk)
+            self.remember(from_disk)
+            found.update(from_disk)
+            missing = [key for key in missing if key not in from_disk]
+
+        if missing:
+            embedding_stats["misses"] += len(missing)
+            text_by_key = dict(zip(keys, texts))
+            embedded = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, self.embed_uncached([text_by_key[key] for key in missing]))
+            }
+            self.remember(embedded)
+            found.update(embedded)
+            if self.store is not None:
+                try:
+                    self.store.put_many(self.model, embedded)
+                except Exception as e:
+                    embedding_stats["errors"] += 1
+                    print(f"Error writing embedding cache: {e}")
+
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_queries(self, texts: list) -> list:
+        keys = [text_hash(text) for text in texts]
+        found = self.from_memory(keys)
+        if len(found) == len(set(keys)):
+            embedding_stats["memory_hits"] += len(found)
+            return [found[key].tolist() for key in keys]
+        # disk and network work stays off the event loop
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_queries([text])[0]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_queries([text]))[0]
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embeddings.embed_documents(texts)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def stats(self) -> dict:
+        lookups = embedding_stats["memory_hits"] + embedding_stats["disk_hits"] + embedding_stats["misses"]
+        return {
+            "model": self.model,
+            "memory_entries": len(self.memory),
+            "max_entries": self.max_entries,
+            "disk_entries": self.store.count() if self.store is not None else None,
+            "path": self.store.path if self.store is not None else None,
+            "hit_ratio": round(1 - embedding_stats["misses"] / lookups, 3) if lookups else None,
+            **embedding_stats
+        }
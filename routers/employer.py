@@ -1,50 +1,138 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Depends
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from db.db_connection import get_db
+from sqlalchemy.orm.attributes import set_committed_value
+from db.db_connection import get_db, SessionLocal
 from db.crud import *
-from db.models.employer import Employer, EmployerSchema, EmployerJobs
-from typing import List, Optional
-import json
+from db.models.employer import Employer, EmployerSchema, EmployerJobs, EmployerResponse
+from db.models.user import User, UserEmployerJobs
+from db.models.loading import load_profile
+from db.models.base import Page, model_response, unpaged_response
+from typing import List, Optional, Union
+import csv, io, json
 
 router = APIRouter()
 
-@router.post("/")
-def employer_list(db: Session = Depends(get_db)):
-    result = get_data(db, Employer)
-    if not result:
+@router.post("/", response_model=Union[List[EmployerResponse], Page[EmployerResponse]])
+def employer_list(
+    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    List employers. With `limit`, returns one page as {"items", "next_cursor"};
+    pass `next_cursor` back as `cursor` to get the following page. Without
+    it, at most LIST_MAX_ROWS employers as a plain list, with the cursor of the
+    rest in the X-Next-Cursor header.
+    """
+    result = get_data(db, Employer, limit=limit or LIST_MAX_ROWS, cursor=cursor, options=load_profile(Employer, "listing"))
+    if not result or (isinstance(result, dict) and "error" in result):
         raise HTTPException(status_code=400, detail=result["error"])
-    return result
+    if limit:
+        return model_response(Page[EmployerResponse], result)
+    return unpaged_response(List[EmployerResponse], result)
+
+# Rows fetched per round trip of the server-side cursor, and per response chunk
+EXPORT_BATCH_SIZE = 1000
+
+# One export row per application, or per job when nobody has applied yet
+EXPORT_COLUMNS = {
+    "job_id": EmployerJobs.id,
+    "job_name": EmployerJobs.name,
+    "jobtype": EmployerJobs.jobtype,
+    "workmode": EmployerJobs.workmode,
+    "level": EmployerJobs.level,
+    "location": EmployerJobs.location,
+    "postedtime": EmployerJobs.postedtime,
+    "application_id": UserEmployerJobs.id,
+    "user_id": UserEmployerJobs.user_id,
+    "user_name": User.name,
+    "user_email": User.email,
+    "match_json": UserEmployerJobs.match_json,
+}
+
+def csv_safe(value):
+    """CSV cell for `value`. JSON is kept as text and leading =+-@ are escaped so spreadsheets do not run them."""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        return "'" + value
+    return value
+
+def export_rows(employer_id: int, format: str):
+    """
+    Yields the export one chunk per EXPORT_BATCH_SIZE rows. Rows are streamed
+    from a server-side cursor on a session owned by the generator, so memory
+    stays flat however many jobs and applications there are.
+    """
+    stmt = (
+        select(*(column.label(name) for name, column in EXPORT_COLUMNS.items()))
+        .outerjoin(UserEmployerJobs, UserEmployerJobs.employer_jobs_id == EmployerJobs.id)
+        .outerjoin(User, User.id == UserEmployerJobs.user_id)
+        .where(EmployerJobs.employer_id == employer_id)
+        .order_by(EmployerJobs.id, UserEmployerJobs.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
 
-@router.post("/{name}")
+    db = SessionLocal()
+    try:
+        for rows in db.execute(stmt).mappings().partitions():
+            if format == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([csv_safe(row[name]) for name in EXPORT_COLUMNS] for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(dict(row), default=str) + "\n" for row in rows)
+    finally:
+        db.close()
+
+@router.get("/{employer_id}/export")
+def employer_export(
+    employer_id: int,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Streams every job of the employer with its applications (including
+    match_json) as NDJSON or CSV, one row per application.
+    """
+    if not db.get(Employer, employer_id):
+        raise HTTPException(status_code=404, detail="Employer not found")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_rows(employer_id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="employer-{employer_id}-jobs.{format}"'}
+    )
+
+@router.post("/{name}", response_model=EmployerResponse)
 def employer_search(name: str, db: Session = Depends(get_db), hide_empty: bool = False):
-    result = get_data(db, Employer, {"name": name})
+    result = get_data(db, Employer, {"name": {"ilike": name}}, options=load_profile(Employer, "profile"))
 
     if not result:
         raise HTTPException(status_code=400, detail=result["error"])
     
     employer_data = result[0]
 
-    if employer_data.jobs:
-        jobs_to_remove = []  # Keep track of jobs to remove
-        try:
-            for jobs in employer_data.jobs:
-                # jobs["match_json"] = json.loads(jobs["match_json"]) if jobs["match_json"] else {}
-                jobs.desc_json = json.loads(jobs.desc_json) if jobs.desc_json else {}
-                jobs.responsibilities = json.loads(jobs.responsibilities) if jobs.responsibilities else []
-                jobs.skills = json.loads(jobs.skills) if jobs.skills else []
-
-                # Check if user_employer_jobs is empty
-                if not jobs.user_employer_jobs:
-                    jobs_to_remove.append(jobs)
-
-                for applied in jobs.user_employer_jobs:
-                    applied.match_json = json.loads(applied.match_json) if applied.match_json else {}
-                    applied.user.about = json.loads(applied.user.about) if applied.user.about else {}
-            
-            if hide_empty:
-                for job in jobs_to_remove:
-                    employer_data.jobs.remove(job)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode 'education' as JSON for user ")
-
-    return employer_data
\ No newline at end of file
+    # JSONB columns come back decoded, only the empty defaults are filled in
+    for job in employer_data.jobs:
+        job.fill_json_defaults()
+        for applied in job.user_employer_jobs:
+            if not applied.match_json:
+                set_committed_value(applied, "match_json", {})
+            if not applied.user.about:
+                set_committed_value(applied.user, "about", {})
+
+    if hide_empty:
+        # Hide jobs nobody has applied to, without touching the session's collection
+        set_committed_value(employer_data, "jobs", [job for job in employer_data.jobs if job.user_employer_jobs])
+
+    return model_response(EmployerResponse, employer_data)
\ No newline at end of file
@@ -1,14 +1,33 @@
 from pydantic import BaseModel, validator, Field
-from typing import List
+from typing import List, Union
 from langchain_mongodb import MongoDBAtlasVectorSearch
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import StrOutputParser
 from pymongo import MongoClient
 from fastapi import HTTPException
+from .guidelines import create_guideline_retriever
+from .llm_cache import CachedChain
+import asyncio
 import os
 import json
 import re
+import time
+
+# A batch is evaluated concurrently: at most EVALUATION_CONCURRENCY questions of
+# one request at a time, and at most EVALUATION_GLOBAL_CONCURRENCY across all
+# requests of this process, to stay inside the Gemini and Atlas rate limits.
+EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", 5))
+EVALUATION_GLOBAL_CONCURRENCY = int(os.getenv("EVALUATION_GLOBAL_CONCURRENCY", 10))
+
+evaluation_slots = asyncio.Semaphore(EVALUATION_GLOBAL_CONCURRENCY)
+
+BEHAVIOR_MODEL = "gemini-1.5-pro"
+BEHAVIOR_EMBEDDING_MODEL = "models/embedding-001"
+# bump when the prompt or the parsing changes, see routers.llm_cache
+BEHAVIOR_PROMPT_VERSION = "2"
 
 # Pydantic Models
 class CandidateResponse(BaseModel):
@@ -100,30 +119,125 @@ class EvaluationResponse(BaseModel):
     personality_traits: List[str]
     ai_analysis: AIAnalysis
 
+class EvaluationError(BaseModel):
+    question: str
+    answer: str
+    error: str
+    status_code: int = 500
+
 class BatchEvaluationResponse(BaseModel):
-    evaluations: List[EvaluationResponse]
+    # in the order of the request; a question that could not be evaluated
+    # gets an EvaluationError instead of failing the batch
+    evaluations: List[Union[EvaluationResponse, EvaluationError]]
+
+def guideline_query(question: str, response: str) -> str:
+    """Text the guidelines are searched (and the query embedded) with."""
+    return question + " " + response
+
+def parse_evaluation(content: str) -> dict:
+    """
+    Extracts and checks the JSON evaluation in the LLM reply. Runs inside the
+    cached chain, so a reply that does not parse raises and is never cached.
+    """
+    # Check if content is empty
+    if not content or content.isspace():
+        raise OutputParserException("Received empty response from LLM", llm_output=content)
+
+    # Try to find JSON in the response (sometimes LLMs add explanatory text)
+    json_match = re.search(r'({[\s\S]*})', content)
+    try:
+        if json_match:
+            try:
+                parsed_result = json.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                # If that fails, try a more aggressive approach
+                parsed_result = json.loads(re.search(r'({[\s\S]*})', content.replace('\n', ' ')).group(1))
+        else:
+            # If no JSON-like structure is found, try to parse the whole response
+            parsed_result = json.loads(content)
+    except json.JSONDecodeError as json_err:
+        raise OutputParserException(f"Invalid JSON in LLM response: {json_err}", llm_output=content)
+
+    # Validate the structure of the parsed result
+    if not isinstance(parsed_result, dict):
+        raise OutputParserException("LLM response is not a JSON object", llm_output=content)
+    required_keys = ["score", "score_breakdown", "feedback", "strengths", "areas_for_improvement", "personality_traits", "ai_analysis"]
+    missing = [key for key in required_keys if key not in parsed_result]
+    if missing:
+        raise OutputParserException(f"Missing {', '.join(missing)} in LLM response", llm_output=content)
+
+    # Ensure score is a float
+    try:
+        parsed_result["score"] = float(parsed_result["score"])
+    except (ValueError, TypeError):
+        raise OutputParserException(f"Invalid score {parsed_result['score']!r} in LLM response", llm_output=content)
+
+    # Ensure lists are actually lists
+    for key in ["strengths", "areas_for_improvement", "personality_traits"]:
+        if not isinstance(parsed_result[key], list):
+            parsed_result[key] = [parsed_result[key]]
+
+    # Ensure all citation page numbers are valid integers
+    for citation in parsed_result.get("citations") or []:
+        if isinstance(citation, dict) and citation.get("page_number") is None:
+            citation["page_number"] = 1
+
+    return parsed_result
+
+def fallback_evaluation(content: str) -> dict:
+    """Neutral evaluation returned when the LLM reply cannot be parsed."""
+    return {
+        "score": 50,  # Default middle score
+        "score_breakdown": {
+            "relevance": 0,
+            "clarity": 0,
+            "specificity": 0,
+            "professional_tone": 0,
+            "completeness": 0
+        },
+        "feedback": f"Failed to parse response. Raw content: {content[:200]}...",
+        "citations": [
+            {
+                "text": "Unable to determine citations due to parsing error",
+                "source": "Error",
+                "page_number": 1  # Changed from 0 to 1
+            }
+        ],
+        "strengths": ["Unable to determine strengths due to parsing error"],
+        "areas_for_improvement": ["Unable to determine areas for improvement due to parsing error"],
+        "personality_traits": ["Unable to determine personality traits due to parsing error"],
+        "ai_analysis": {
+            "ai_probability": 0.5,  # Default middle probability
+            "confidence_level": 0.5,  # Default confidence level
+            "reasoning": "Failed to parse response, unable to determine AI-generated probability.",
+            "ai_indicators": ["Unable to determine due to parsing error"],
+            "human_indicators": ["Unable to determine due to parsing error"],
+            "recommendation": "Uncertain due to parsing error"
+        }
+    }
 
 # Evaluator Class
 class BehaviorEvaluator:
-    def __init__(self):
+    def __init__(self, llm: ChatGoogleGenerativeAI = None, embeddings: GoogleGenerativeAIEmbeddings = None, client: MongoClient = None):
         # Get API key from environment variable
         api_key = os.getenv("GOOGLE_API_KEY")
         
-        # Initialize LLM with Vertex AI key
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-pro",
+        # Initialize LLM with Vertex AI key; pass llm, embeddings and client to
+        # share them, see routers.evaluators
+        self.llm = llm if llm is not None else ChatGoogleGenerativeAI(
+            model=BEHAVIOR_MODEL,
             temperature=0.3,
             google_api_key=api_key
         )
 
         # Initialize embeddings with Vertex AI key
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
+        self.embeddings = embeddings if embeddings is not None else GoogleGenerativeAIEmbeddings(
+            model=BEHAVIOR_EMBEDDING_MODEL,
             google_api_key=api_key
         )
 
         # MongoDB setup
-        self.client = MongoClient(os.getenv("MONGODB_ATLAS_CLUSTER_URI"))
+        self.client = client if client is not None else MongoClient(os.getenv("MONGODB_ATLAS_CLUSTER_URI"))
         self.collection = self.client.behavioral_db.behavioral_collection
 
         # Initialize vector store
@@ -134,6 +248,11 @@ class BehaviorEvaluator:
             relevance_score_fn="cosine",
         )
 
+        # Guideline search, local index or Atlas depending on GUIDELINE_RETRIEVER
+        self.retriever = create_guideline_retriever(
+            self.collection, self.embeddings, self.vector_store, getattr(self.embeddings, "model", BEHAVIOR_EMBEDDING_MODEL)
+        )
+
         # Evaluation prompt
         self.evaluation_prompt = PromptTemplate(
             input_variables=["question", "response", "criteria"],
@@ -211,6 +330,10 @@ class BehaviorEvaluator:
             """
         )
 
+        self.chain = CachedChain(
+            "behavior", self.evaluation_prompt | self.llm | StrOutputParser() | parse_evaluation, self.evaluation_prompt, self.llm.model, BEHAVIOR_PROMPT_VERSION
+        )
+
     async def evaluate_response(self, question: str, response: str) -> dict:
         try:
             # Additional validation to prevent processing placeholder or empty responses
@@ -220,110 +343,35 @@ class BehaviorEvaluator:
                     detail="Please provide an actual response, not the placeholder 'string' or an empty response"
                 )
                 
-            # Retrieve relevant interview guidelines from MongoDB
-            similar_docs = self.vector_store.similarity_search(
-                query=question + " " + response,
+            # Retrieve relevant interview guidelines
+            guidelines = await self.retriever.search(
+                guideline_query(question, response),
                 k=3  # Retrieve top 3 relevant documents
             )
             
             # Combine relevant guidelines
-            criteria = "\n".join([doc.page_content for doc in similar_docs])
-
-            # Use the new recommended approach with RunnableSequence
-            chain = self.evaluation_prompt | self.llm
-            result = await chain.ainvoke({
-                "question": question,
-                "response": response,
-                "criteria": criteria
-            })
-            
-            # Extract content from the response
-            content = result.content if hasattr(result, 'content') else str(result)
-            # print(f"Raw LLM response type: {type(result)}")
-            # print(f"Raw LLM response: {content}")
-            
-            # Check if content is empty
-            if not content or content.isspace():
-                raise HTTPException(
-                    status_code=500, 
-                    detail="Received empty response from LLM"
-                )
-            
-            # Try to find JSON in the response (sometimes LLMs add explanatory text)
-            json_match = re.search(r'({[\s\S]*})', content)
-            if json_match:
-                json_str = json_match.group(1)
-                # print(f"Extracted JSON: {json_str}")
-                try:
-                    parsed_result = json.loads(json_str)
-                except json.JSONDecodeError:
-                    # If that fails, try a more aggressive approach
-                    json_str = re.search(r'({[\s\S]*})', content.replace('\n', ' ')).group(1)
-                    parsed_result = json.loads(json_str)
-            else:
-                # If no JSON-like structure is found, try to parse the whole response
-                try:
-                    parsed_result = json.loads(content)
-                except json.JSONDecodeError as json_err:
-                    print(f"JSON parsing error: {str(json_err)}")
-                    print(f"Content that failed to parse: {content}")
-                    
-                    parsed_result = {
-                        "score": 50,  # Default middle score
-                        "score_breakdown": {
-                            "relevance": 0,
-                            "clarity": 0,
-                            "specificity": 0,
-                            "professional_tone": 0,
-                            "completeness": 0
-                        },
-                        "feedback": f"Failed to parse response. Raw content: {content[:200]}...",
-                        "citations": [
-                            {
-                                "text": "Unable to determine citations due to parsing error",
-                                "source": "Error",
-                                "page_number": 1  # Changed from 0 to 1
-                            }
-                        ],
-                        "strengths": ["Unable to determine strengths due to parsing error"],
-                        "areas_for_improvement": ["Unable to determine areas for improvement due to parsing error"],
-                        "personality_traits": ["Unable to determine personality traits due to parsing error"],
-                        "ai_analysis": {
-                            "ai_probability": 0.5,  # Default middle probability
-                            "confidence_level": 0.5,  # Default confidence level
-                            "reasoning": "Failed to parse response, unable to determine AI-generated probability.",
-                            "ai_indicators": ["Unable to determine due to parsing error"],
-                            "human_indicators": ["Unable to determine due to parsing error"],
-                            "recommendation": "Uncertain due to parsing error"
-                        }
-                    }
-                    print(f"Using fallback response: {parsed_result}")
-            
-            # Validate the structure of the parsed result
-            required_keys = ["score", "score_breakdown", "feedback", "strengths", "areas_for_improvement", "personality_traits", "ai_analysis"]
-            for key in required_keys:
-                if key not in parsed_result:
-                    parsed_result[key] = f"Missing {key} in response"
-                    print(f"Added missing key: {key}")
-            
-            # Ensure score is a float
-            if not isinstance(parsed_result["score"], (int, float)):
-                try:
-                    parsed_result["score"] = float(parsed_result["score"])
-                except (ValueError, TypeError):
-                    parsed_result["score"] = 50.0  # Default score
-            
-            # Ensure lists are actually lists
-            for key in ["strengths", "areas_for_improvement", "personality_traits"]:
-                if not isinstance(parsed_result[key], list):
-                    parsed_result[key] = [parsed_result[key]]
-            
-            # Ensure all citation page numbers are valid integers
-            if "citations" in parsed_result:
-                for i in range(len(parsed_result["citations"])):
-                    if "page_number" not in parsed_result["citations"][i] or parsed_result["citations"][i]["page_number"] is None:
-                        parsed_result["citations"][i]["page_number"] = 1
-            
+            criteria = "\n".join(guidelines)
+
+            # Use the new recommended approach with RunnableSequence; the
+            # reply is parsed inside the (cached) chain
+            try:
+                parsed_result = await self.chain.ainvoke({
+                    "question": question,
+                    "response": response,
+                    "criteria": criteria
+                })
+            except OutputParserException as parse_err:
+                content = parse_err.llm_output or ""
+                if not content or content.isspace():
+                    raise HTTPException(
+                        status_code=500,
+                        detail="Received empty response from LLM"
+                    )
+                print(f"JSON parsing error: {str(parse_err)}")
+                print(f"Content that failed to parse: {content}")
+                parsed_result = fallback_evaluation(content)
+                print(f"Using fallback response: {parsed_result}")
+
             # Add the question to the response
             parsed_result["question"] = question
             parsed_result["answer"] = response
@@ -334,4 +382,36 @@ class BehaviorEvaluator:
             raise http_ex
         except Exception as e:
             print(f"Error in evaluate_response: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def evaluate_batch(self, responses: List[CandidateResponse]) -> List[dict]:
+        """
+        Evaluates every question concurrently, within the per-request and
+        global limits. Results keep the input order; a failed question yields
+        {"question", "answer", "error", "status_code"} instead of raising.
+        """
+        request_slots = asyncio.Semaphore(EVALUATION_CONCURRENCY)
+
+        # Embed the search queries of the whole batch in one call, each
+        # evaluation's search below then finds its embedding in the cache
+        if hasattr(self.embeddings, "aembed_queries"):
+            try:
+                await self.embeddings.aembed_queries([guideline_query(qr.question, qr.response) for qr in responses])
+            except Exception as e:
+                print(f"Error embedding the batch queries: {str(e)}")
+
+        async def evaluate_one(qr: CandidateResponse) -> dict:
+            async with request_slots, evaluation_slots:
+                try:
+                    return await self.evaluate_response(question=qr.question, response=qr.response)
+                except HTTPException as e:
+                    return {"question": qr.question, "answer": qr.response, "error": str(e.detail), "status_code": e.status_code}
+                except Exception as e:
+                    print(f"Error in evaluate_batch: {str(e)}")
+                    return {"question": qr.question, "answer": qr.response, "error": str(e), "status_code": 500}
+
+        start = time.perf_counter()
+        evaluations = await asyncio.gather(*(evaluate_one(qr) for qr in responses))
+        failed = sum("error" in evaluation for evaluation in evaluations)
+        print(f"Evaluated {len(evaluations)} responses ({failed} failed) in {time.perf_counter() - start:.1f}s")
+        return evaluations
@@ -0,0 +1,142 @@
+from langchain_google_genai import GoogleGenerativeAI, ChatGoogleGenerativeAI
+from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from pymongo import MongoClient
+from .evaluator import BehaviorEvaluator, BEHAVIOR_MODEL, BEHAVIOR_EMBEDDING_MODEL
+from .job_evaluator import JobEvaluator, JOB_MODEL
+from .resume_evaluator import ResumeEvaluator, RESUME_MODEL
+from .skillset_generator import SkillsetGenerator, SKILLSET_MODEL
+from .guidelines import LocalGuidelineRetriever, load_guidelines, refresh_guidelines_periodically
+from .embedding_cache import CachedEmbeddings, create_store
+import asyncio, inspect, os, threading
+
+# The evaluators keep no per-request state, so one instance of each (with its
+# prebuilt chain) serves every request. They share the clients below: one
+# Gemini client per model and temperature, one cached embeddings client per
+# model, and a single MongoClient, whose connection pool is used by every Atlas
+# vector search. start_evaluators()
+# builds them in the app lifespan and close_evaluators() closes the
+# connections; outside the app (seeds, scripts) they are built on first use.
+
+clients = {}
+evaluators = {}
+registry_lock = threading.RLock()
+background_tasks = []
+
+
+def shared_client(key: tuple, factory):
+    with registry_lock:
+        if key not in clients:
+            clients[key] = factory()
+        return clients[key]
+
+
+def gemini_llm(model: str, temperature: float) -> GoogleGenerativeAI:
+    return shared_client(("llm", model, temperature), lambda: GoogleGenerativeAI(
+        model=model, temperature=temperature, api_key=os.getenv("GOOGLE_API_KEY")
+    ))
+
+
+def gemini_chat(model: str, temperature: float) -> ChatGoogleGenerativeAI:
+    return shared_client(("chat", model, temperature), lambda: ChatGoogleGenerativeAI(
+        model=model, temperature=temperature, google_api_key=os.getenv("GOOGLE_API_KEY")
+    ))
+
+
+def gemini_embeddings(model: str) -> CachedEmbeddings:
+    return shared_client(("embeddings", model), lambda: CachedEmbeddings(
+        GoogleGenerativeAIEmbeddings(model=model, google_api_key=os.getenv("GOOGLE_API_KEY")),
+        store=create_store()
+    ))
+
+
+def mongo_client() -> MongoClient:
+    return shared_client(("mongo",), lambda: MongoClient(os.getenv("MONGODB_ATLAS_CLUSTER_URI")))
+
+
+EVALUATOR_FACTORIES = {
+    "behavior": lambda: BehaviorEvaluator(
+        llm=gemini_chat(BEHAVIOR_MODEL, 0.3),
+        embeddings=gemini_embeddings(BEHAVIOR_EMBEDDING_MODEL),
+        client=mongo_client()
+    ),
+    "job": lambda: JobEvaluator(llm=gemini_llm(JOB_MODEL, 0)),
+    "resume": lambda: ResumeEvaluator(llm=gemini_llm(RESUME_MODEL, 0)),
+    "skillset": lambda: SkillsetGenerator(llm=gemini_chat(SKILLSET_MODEL, 0)),
+}
+
+
+def get_evaluator(name: str):
+    with registry_lock:
+        if name not in evaluators:
+            evaluators[name] = EVALUATOR_FACTORIES[name]()
+        return evaluators[name]
+
+
+def get_behavior_evaluator() -> BehaviorEvaluator:
+    return get_evaluator("behavior")
+
+
+def get_job_evaluator() -> JobEvaluator:
+    return get_evaluator("job")
+
+
+def get_resume_evaluator() -> ResumeEvaluator:
+    return get_evaluator("resume")
+
+
+def get_skillset_generator() -> SkillsetGenerator:
+    return get_evaluator("skillset")
+
+
+async def start_evaluators():
+    """
+    Builds every evaluator up front, so the first requests do not pay for it,
+    loads the local guideline index and starts its refresh.
+    """
+    for name in EVALUATOR_FACTORIES:
+        try:
+            get_evaluator(name)
+        except Exception as e:
+            print(f"Error creating evaluator {name}: {e}")
+
+    retriever = getattr(evaluators.get("behavior"), "retriever", None)
+    if isinstance(retriever, LocalGuidelineRetriever):
+        await load_guidelines(retriever)
+        background_tasks.append(asyncio.create_task(refresh_guidelines_periodically(retriever)))
+
+
+async def close_client(client):
+    """Closes a MongoClient, an embedding cache or the transports behind a Gemini client."""
+    if isinstance(client, MongoClient):
+        client.close()
+        return
+    if isinstance(client, CachedEmbeddings):
+        client.close()
+        client = client.embeddings
+    # GoogleGenerativeAI wraps a ChatGoogleGenerativeAI in `client`
+    holders = [client, getattr(client, "client", None)]
+    for holder in holders:
+        for name in ("client", "async_client_running"):
+            transport = getattr(getattr(holder, name, None), "transport", None)
+            if transport is not None and hasattr(transport, "close"):
+                closed = transport.close()
+                if inspect.isawaitable(closed):
+                    await closed
+
+
+async def close_evaluators():
+    """Drops the evaluators and closes the shared clients, called on app shutdown."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+    with registry_lock:
+        closing = list(clients.items())
+        clients.clear()
+        evaluators.clear()
+    for key, client in closing:
+        try:
+            await close_client(client)
+        except Exception as e:
+            print(f"Error closing client {key[0]}: {e}")
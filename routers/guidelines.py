@@ -0,0 +1,215 @@
+from langchain_mongodb import MongoDBAtlasVectorSearch
+from pymongo.collection import Collection
+import numpy as np
+import asyncio, os, tempfile, threading, time
+
+# Retrieval of the interview guidelines behind the behavioral evaluation.
+#
+# GUIDELINE_RETRIEVER picks the backend:
+#   local - cosine top-k over an in-process matrix of the guideline embeddings
+#           (default). It is built from the Atlas collection before the app
+#           takes traffic (waiting up to GUIDELINE_STARTUP_TIMEOUT seconds)
+#           and rebuilt every GUIDELINE_REFRESH_SECONDS, so Atlas is only read
+#           in the background.
+#   atlas - a $vectorSearch on Atlas per question, as before.
+# Only the query embedding still needs a network call with the local backend.
+#
+# GUIDELINE_SNAPSHOT optionally names a file the index is saved to and loaded
+# from at startup, so the app starts with an index even while Atlas is down.
+# It has to be on durable storage (a mounted volume): the container filesystem
+# on Cloud Run is in memory and starts empty, so by default there is none.
+GUIDELINE_RETRIEVER = os.getenv("GUIDELINE_RETRIEVER", "local").lower()
+GUIDELINE_SNAPSHOT = os.getenv("GUIDELINE_SNAPSHOT", "")
+GUIDELINE_REFRESH_SECONDS = int(os.getenv("GUIDELINE_REFRESH_SECONDS", 3600))
+GUIDELINE_STARTUP_TIMEOUT = float(os.getenv("GUIDELINE_STARTUP_TIMEOUT", 30))
+GUIDELINE_ATLAS_TIMEOUT = float(os.getenv("GUIDELINE_ATLAS_TIMEOUT", 10))
+
+# field names MongoDBAtlasVectorSearch stores the guidelines under
+GUIDELINE_TEXT_KEY = "text"
+GUIDELINE_EMBEDDING_KEY = "embedding"
+
+# Served at /metrics/guidelines
+guideline_stats = {"searches": 0, "fallbacks": 0, "errors": 0, "refreshes": 0, "refresh_errors": 0, "total_us": 0.0, "max_us": 0.0}
+
+
+def record_search(elapsed_us: float):
+    guideline_stats["searches"] += 1
+    guideline_stats["total_us"] += elapsed_us
+    guideline_stats["max_us"] = max(guideline_stats["max_us"], elapsed_us)
+
+
+class AtlasGuidelineRetriever:
+    """Atlas $vectorSearch per query. A slow or failing search returns no guidelines."""
+
+    name = "atlas"
+
+    def __init__(self, vector_store: MongoDBAtlasVectorSearch, timeout: float = GUIDELINE_ATLAS_TIMEOUT):
+        self.vector_store = vector_store
+        self.timeout = timeout
+
+    async def search(self, query: str, k: int) -> list:
+        start = time.perf_counter()
+        try:
+            docs = await asyncio.wait_for(self.vector_store.asimilarity_search(query=query, k=k), timeout=self.timeout)
+        except Exception as e:
+            guideline_stats["errors"] += 1
+            print(f"Error searching guidelines on Atlas: {e!r}")
+            return []
+        record_search((time.perf_counter() - start) * 1e6)
+        return [doc.page_content for doc in docs]
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class LocalGuidelineRetriever:
+    """
+    Cosine top-k over the guideline embeddings held in memory. The matrix rows
+    are normalized once, so a search is one matrix-vector product. Until an
+    index is loaded, searches go to `fallback`.
+    """
+
+    name = "local"
+
+    def __init__(self, collection: Collection, embeddings, model: str, snapshot_path: str = GUIDELINE_SNAPSHOT, fallback=None):
+        self.collection = collection
+        self.embeddings = embeddings
+        self.model = model
+        self.snapshot_path = snapshot_path
+        self.fallback = fallback
+        self.texts = []
+        self.matrix = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def set_index(self, texts: list, vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or len(texts) != len(matrix):
+            raise ValueError(f"Expected one embedding per guideline, got {matrix.shape} for {len(texts)} texts")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        # swapped in one assignment, searches never see a half-built index
+        with self.lock:
+            self.texts, self.matrix, self.loaded_at = list(texts), matrix, time.time()
+
+    def load_snapshot(self) -> bool:
+        """Loads the index saved by refresh(). False when there is no usable snapshot."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with np.load(self.snapshot_path, allow_pickle=False) as snapshot:
+                if str(snapshot["model"]) != self.model:
+                    print(f"Ignoring guideline snapshot built with {snapshot['model']}, expected {self.model}")
+                    return False
+                self.set_index(snapshot["texts"].tolist(), snapshot["embeddings"])
+        except Exception as e:
+            print(f"Error loading guideline snapshot {self.snapshot_path}: {e}")
+            return False
+        print(f"Loaded {len(self.texts)} guidelines from {self.snapshot_path}")
+        return True
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self.lock:
+            texts, matrix = self.texts, self.matrix
+        # a temp file of its own next to the snapshot, so concurrent refreshes
+        # (or workers) never write into the same file before the rename
+        directory, name = os.path.split(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, texts=np.array(texts, dtype=str), embeddings=matrix, model=np.array(self.model))
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def refresh(self) -> int:
+        """Rebuilds the index from the Atlas collection and saves the snapshot, if any. Blocking."""
+        texts, vectors = [], []
+        projection = {GUIDELINE_TEXT_KEY: 1, GUIDELINE_EMBEDDING_KEY: 1, "_id": 0}
+        for doc in self.collection.find({GUIDELINE_EMBEDDING_KEY: {"$exists": True}}, projection):
+            texts.append(doc.get(GUIDELINE_TEXT_KEY) or "")
+            vectors.append(doc[GUIDELINE_EMBEDDING_KEY])
+        if not texts:
+            raise ValueError("No guidelines with embeddings in the collection")
+        self.set_index(texts, vectors)
+        self.save_snapshot()
+        guideline_stats["refreshes"] += 1
+        print(f"Refreshed {len(texts)} guidelines from Atlas")
+        return len(texts)
+
+    def top_k(self, vector, k: int) -> list:
+        with self.lock:
+            texts, matrix = self.texts, self.matrix
+        if matrix is None or not len(texts):
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+        k = min(k, len(texts))
+        best = np.argpartition(-scores, k - 1)[:k]
+        return [texts[i] for i in best[np.argsort(-scores[best])]]
+
+    async def search(self, query: str, k: int) -> list:
+        if self.matrix is None:
+            if self.fallback is None:
+                return []
+            guideline_stats["fallbacks"] += 1
+            return await self.fallback.search(query, k)
+
+        try:
+            vector = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            guideline_stats["errors"] += 1
+            print(f"Error embedding guideline query: {e!r}")
+            return []
+        start = time.perf_counter()
+        texts = self.top_k(vector, k)
+        record_search((time.perf_counter() - start) * 1e6)
+        return texts
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "guidelines": len(self.texts),
+            "snapshot": self.snapshot_path,
+            "age_seconds": round(time.time() - self.loaded_at) if self.loaded_at else None,
+            "refresh_seconds": GUIDELINE_REFRESH_SECONDS,
+        }
+
+
+def create_guideline_retriever(collection: Collection, embeddings, vector_store: MongoDBAtlasVectorSearch, model: str, backend: str = GUIDELINE_RETRIEVER):
+    atlas = AtlasGuidelineRetriever(vector_store)
+    if backend == "atlas":
+        return atlas
+    local = LocalGuidelineRetriever(collection, embeddings, model, fallback=atlas)
+    local.load_snapshot()
+    return local
+
+
+async def load_guidelines(retriever: LocalGuidelineRetriever, timeout: float = GUIDELINE_STARTUP_TIMEOUT):
+    """
+    Builds the index from Atlas at startup unless a snapshot was loaded. If
+    that fails or times out, searches go to Atlas until a refresh succeeds.
+    """
+    if retriever.matrix is not None:
+        return
+    try:
+        await asyncio.wait_for(asyncio.to_thread(retriever.refresh), timeout=timeout)
+    except Exception as e:
+        guideline_stats["refresh_errors"] += 1
+        print(f"Error loading guidelines from Atlas at startup, searching Atlas until a refresh succeeds: {e!r}")
+
+
+async def refresh_guidelines_periodically(retriever: LocalGuidelineRetriever):
+    """Background task keeping the local index in step with Atlas."""
+    while True:
+        # retry sooner while there is no index at all, see load_guidelines
+        await asyncio.sleep(GUIDELINE_REFRESH_SECONDS if retriever.matrix is not None else min(60, GUIDELINE_REFRESH_SECONDS))
+        try:
+            await asyncio.to_thread(retriever.refresh)
+        except Exception as e:
+            guideline_stats["refresh_errors"] += 1
+            print(f"Error refreshing guidelines from Atlas: {e!r}")
@@ -3,12 +3,18 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_google_genai import GoogleGenerativeAI
 from db.models.user import JobReport
+from .llm_cache import CachedChain
 import json, os
 
+JOB_MODEL = "gemini-1.5-flash"
+# bump when the prompt or the parsing changes, see routers.llm_cache
+JOB_PROMPT_VERSION = "1"
+
 class JobEvaluator:
-    def __init__(self):
-        self.llm = GoogleGenerativeAI(
-            model='gemini-1.5-flash',
+    def __init__(self, llm: GoogleGenerativeAI = None):
+        # pass `llm` to share a client, see routers.evaluators
+        self.llm = llm if llm is not None else GoogleGenerativeAI(
+            model=JOB_MODEL,
             temperature=0,
             api_key=os.getenv("GOOGLE_API_KEY")
         )
@@ -73,17 +79,16 @@ class JobEvaluator:
             Return only the JSON object, no other text."""
         )
 
+        self.chain = CachedChain(
+            "job",
+            self.evaluation_prompt | self.llm | JsonOutputParser(pydantic_object=JobReport),
+            self.evaluation_prompt, self.llm.model, JOB_PROMPT_VERSION
+        )
+
     async def evaluate_job_match(self, job_description: str, resume: str) -> dict:
         try:
-            # Create the chain correctly
-            chain = (
-                self.evaluation_prompt 
-                | self.llm 
-                | JsonOutputParser(pydantic_object=JobReport)
-            )
-            
             # Invoke chain with the text
-            response = await chain.ainvoke({
+            response = await self.chain.ainvoke({
                 "job_description": json.dumps(job_description),
                 "resume": json.dumps(resume)
             })
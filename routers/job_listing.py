@@ -1,102 +1,300 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Header
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
+from sqlalchemy import func, select, or_, tuple_, Text
 from db.db_connection import get_db
 from db.crud import *
-from db.models.employer import Employer, EmployerJobs
+from db.models.employer import Employer, EmployerJobs, JobDocument
 from db.models.user import User, UserEmployerJobs
+from db.models.loading import load_profile
+from db.models.base import NEXT_CURSOR_HEADER
+from db.query_counter import query_budget
+from db.cache import cached_response
+from db.etag import fetch_table_versions, etags_available, weak_etag, etag_matches, not_modified
 from typing import List, Optional
-import json
+import json, re
 
 router = APIRouter()
 
+# Text search configuration, must match the one in the search_vector column
+SEARCH_LANGUAGE = "english"
+SNIPPET_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10"
+
+# job documents page, user lookup, applications for the page
+JOB_LISTING_MAX_QUERIES = 3
+
+# Cached responses and the tables they are built from; writes through db.crud
+# to any of these tables invalidate the namespace.
+JOB_LISTING_TABLES = ("employer_jobs", "employers", "user_employer_jobs", "users")
+JOB_SEARCH_TABLES = ("employer_jobs", "employers")
+
+# Job documents are read as text and written to the response unparsed
+JOB_DOCUMENT_TEXT = JobDocument.doc.cast(Text).label("doc")
+
+def splice_document(doc: str, **fields) -> str:
+    """Appends `fields` to a serialized JSON object without parsing it."""
+    if not fields:
+        return doc
+    extra = ", ".join(f"{json.dumps(key)}: {json.dumps(value, default=str)}" for key, value in fields.items())
+    return f"{doc[:-1]}, {extra}}}"
+
+def documents_response(documents: List[str], **fields) -> Response:
+    """
+    JSON array of serialized documents, or an object with the array as
+    "items" next to `fields` (e.g. next_cursor) when any are given.
+    """
+    items = "[" + ", ".join(documents) + "]"
+    if fields:
+        items = splice_document('{"items": ' + items + "}", **fields)
+    return Response(content=items, media_type="application/json")
+
+@router.get("/")
 @router.post("/")
 def get_all_jobs(
     db: Session = Depends(get_db),
     id: Optional[int] = None,
     employer_id: Optional[int] = None,
-    email: Optional[str] = None
+    email: Optional[str] = None,
+    skills: Optional[List[str]] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Get all job listings with employer details.
     If email is provided, shows if the user has applied.
+    If employer_id is provided, `applications` lists every application per job.
+    `skills` keeps jobs that require all of the given skills.
+    With `limit`, returns one page as {"items", "next_cursor"}; without it, at
+    most LIST_MAX_ROWS jobs with the cursor of the rest in X-Next-Cursor.
+    Responses carry a weak ETag; a matching If-None-Match gets a 304 after a
+    single lookup of the table version counters.
     """
-    # Base query with employer join
-    query = db.query(EmployerJobs).join(Employer)
+    etag = None
+    if etags_available():
+        tables = JOB_LISTING_TABLES if email or employer_id else JOB_SEARCH_TABLES
+        etag = weak_etag(
+            "jobs", id, employer_id, email, sorted(skills or []), limit, cursor, *fetch_table_versions(db, tables)
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    response = job_listing_response(
+        db=db, id=id, employer_id=employer_id, email=email, skills=skills, limit=limit, cursor=cursor, version=etag
+    )
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+@cached_response("jobs.listing", JOB_LISTING_TABLES)
+@query_budget(JOB_LISTING_MAX_QUERIES)
+def job_listing_response(db: Session, id, employer_id, email, skills, limit, cursor, version: str) -> Response:
+    """
+    Builds the get_all_jobs body. `version` is only part of the cache key, so
+    a change made through another worker is never served from this one's cache.
+    """
+    # Pre-built job documents, see JobDocument
+    query = db.query(JobDocument.id, JOB_DOCUMENT_TEXT)
     if id is not None:
-        query = query.filter(EmployerJobs.id == id)
+        query = query.filter(JobDocument.id == id)
     if employer_id is not None:
-        query = query.filter(EmployerJobs.employer_id == employer_id)
-    jobs = query.all()
+        query = query.filter(JobDocument.employer_id == employer_id)
+    if skills:
+        query = query.join(EmployerJobs, EmployerJobs.id == JobDocument.id).filter(
+            *build_filters(EmployerJobs, {"skills": {"contains": skills}})
+        )
+    try:
+        query = apply_keyset(query, JobDocument, limit or LIST_MAX_ROWS, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page = page_result(query.all(), limit or LIST_MAX_ROWS)
+    jobs, next_cursor = page["items"], page["next_cursor"]
     
     # Get user_id if email provided
     user_id = None
     if email:
-        user = db.query(User).filter(User.email == email).first()
+        user = db.query(User).filter(User.email == email).options(*load_profile(User, "minimal")).first()
         if user:
             user_id = user.id
-    
-    # Convert SQLAlchemy objects to dictionaries for modification
-    jobs_data = []
-    for job in jobs:
-        # Check if current user has applied
-        user_application = None
-        application = None
-        if user_id:
-            application = db.query(UserEmployerJobs).filter(
-                UserEmployerJobs.employer_jobs_id == job.id,
-                UserEmployerJobs.user_id == user_id
-            ).first()
 
-        if employer_id:
-            application = db.query(UserEmployerJobs).filter(
-                UserEmployerJobs.employer_jobs_id == job.id
-            ).first()
-            
-        if application:
-            user_application = {
+    # Fetch the applications for the whole page in one query. Employers see every
+    # application to their jobs, a user only sees their own.
+    applications_by_job = {}
+    job_ids = [job.id for job in jobs]
+    if job_ids and (employer_id or user_id):
+        application_query = db.query(UserEmployerJobs).filter(
+            UserEmployerJobs.employer_jobs_id.in_(job_ids)
+        )
+        if not employer_id:
+            application_query = application_query.filter(UserEmployerJobs.user_id == user_id)
+        application_query = application_query.options(*load_profile(UserEmployerJobs, "listing"))
+        for application in application_query.order_by(UserEmployerJobs.id):
+            applications_by_job.setdefault(application.employer_jobs_id, []).append({
                 "id": application.id or 0,
                 "user_id": application.user_id or 0,
                 "employer_jobs_id": application.employer_jobs_id or 0,
-                # "match_json": application.match_json or ""
-                "match_json": json.loads(application.match_json) if application.match_json else {},
+                "match_json": application.match_json or {},
                 "user": {
                     "id": application.user.id or 0,
                     "name": application.user.name or "",
                     "email": application.user.email or ""
-                }
-            }
-        
-        job_dict = {
-            "id": job.id or 0,
-            "employer_id": job.employer_id or 0,
-            "name": job.name or "",
-            "description": job.description or "",
-            "desc_json": json.loads(job.desc_json) if job.desc_json else {},
-            "summary": job.summary or "",
-            "responsibilities": json.loads(job.responsibilities) if job.responsibilities else [],
-            "qualifications": job.qualifications or "",
-            "skills": json.loads(job.skills) if job.skills else [],
-            "experience": job.experience or "",
-            "experienceyear": job.experienceyear or "",
-            "postedtime": job.postedtime or "",
-            "jobtype": job.jobtype or "",
-            "workmode": job.workmode or "",
-            "level": job.level or "",
-            "location": job.location or "",
-            "employer": {
-                "id": job.employer.id or 0,
-                "name": job.employer.name or "",
-                "info": job.employer.info or "",
-                "logo": job.employer.logo or "",
-                "location": job.employer.location or "",
-                "businessnature": job.employer.businessnature or ""
-            },
-            "user_application": user_application or ""
-        }
-        
-        jobs_data.append(job_dict)
+                } if application.user else {}
+            })
+    
+    documents = []
+    for job in jobs:
+        applications = applications_by_job.get(job.id, [])
+        # the user's own application, or the first one when listing an employer's jobs
+        user_application = applications[0] if applications else None
+        documents.append(splice_document(
+            job.doc, user_application=user_application or "", applications=applications
+        ))
+    
+    if limit:
+        return documents_response(documents, next_cursor=next_cursor)
+    response = documents_response(documents)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+def fulltext_query(search_term: str):
+    """
+    Prefix-matching tsquery for the words in `search_term`, e.g. "data eng"
+    becomes to_tsquery('english', 'data:* & eng:*'). None when there are no words.
+    """
+    terms = re.findall(r"\w+", search_term.lower())
+    if not terms:
+        return None
+    return func.to_tsquery(SEARCH_LANGUAGE, " & ".join(f"{term}:*" for term in terms))
+
+@router.post("/search")
+@cached_response("jobs.search", JOB_SEARCH_TABLES)
+def search_jobs(
+    search_term: str = "",
+    jobtype: Optional[str] = None,
+    workmode: Optional[str] = None,
+    level: Optional[str] = None,
+    location: Optional[str] = None,
+    employer_id: Optional[int] = None,
+    mode: str = Query("relevance", pattern="^(relevance|substring)$"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    facets: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Search job listings with various filters.
+
+    mode=relevance (default) matches words and word prefixes against the
+    full-text index, orders by rank (name > summary > description) and adds a
+    highlighted `snippet` of the description. mode=substring keeps the old
+    ILIKE matching in insertion order. At most `limit` (default
+    LIST_MAX_ROWS) jobs are returned.
+    With `facets`, returns {"items", "facets"} where `facets` holds the
+    jobtype/workmode/level/location/employer counts of every match, not just
+    the returned page.
+    """
+    filters = []
+    if employer_id is not None:
+        filters.append(EmployerJobs.employer_id == employer_id)
+    if jobtype:
+        filters.append(EmployerJobs.jobtype == jobtype)
+    if workmode:
+        filters.append(EmployerJobs.workmode == workmode)
+    if level:
+        filters.append(EmployerJobs.level == level)
+    if location:
+        filters.append(EmployerJobs.location.ilike(f"%{escape_like(location)}%", escape="\\"))
+
+    tsquery = fulltext_query(search_term) if mode == "relevance" else None
+    if tsquery is not None:
+        # a query of only stop words ("the") has no nodes and matches everything
+        filters.append(or_(EmployerJobs.search_vector.bool_op("@@")(tsquery), func.numnode(tsquery) == 0))
+    elif search_term and mode == "substring":
+        search = f"%{escape_like(search_term)}%"
+        filters.append(
+            (EmployerJobs.name.ilike(search, escape="\\")) |
+            (EmployerJobs.description.ilike(search, escape="\\")) |
+            (EmployerJobs.summary.ilike(search, escape="\\"))
+        )
+
+    if tsquery is not None:
+        # Rank and limit on the index first, then build snippets for the page only
+        rank = func.ts_rank_cd(EmployerJobs.search_vector, tsquery)
+        ranked = (
+            select(EmployerJobs.id.label("id"), rank.label("rank"))
+            .where(*filters)
+            .order_by(rank.desc(), EmployerJobs.id)
+            .limit(limit or LIST_MAX_ROWS)
+            .subquery()
+        )
+        snippet = func.ts_headline(
+            SEARCH_LANGUAGE, func.coalesce(EmployerJobs.description, ""), tsquery, SNIPPET_OPTIONS
+        )
+        rows = (
+            db.query(JOB_DOCUMENT_TEXT, ranked.c.rank, snippet)
+            .select_from(ranked)
+            .join(JobDocument, JobDocument.id == ranked.c.id)
+            .join(EmployerJobs, EmployerJobs.id == ranked.c.id)
+            .order_by(ranked.c.rank.desc(), ranked.c.id)
+            .all()
+        )
+        documents = [splice_document(doc, rank=job_rank, snippet=job_snippet) for doc, job_rank, job_snippet in rows]
+    else:
+        rows = (
+            db.query(JOB_DOCUMENT_TEXT)
+            .join(EmployerJobs, EmployerJobs.id == JobDocument.id)
+            .filter(*filters)
+            .order_by(JobDocument.id)
+            .limit(limit or LIST_MAX_ROWS)
+            .all()
+        )
+        documents = [doc for doc, in rows]
     
-    return jobs_data
+    if facets:
+        return documents_response(documents, facets=job_facets(db, filters))
+    return documents_response(documents)
+
+# Facet name -> grouping column. The employer facet also groups by the
+# employer name so the sidebar can label it without another lookup.
+FACET_COLUMNS = {
+    "jobtype": EmployerJobs.jobtype,
+    "workmode": EmployerJobs.workmode,
+    "level": EmployerJobs.level,
+    "location": EmployerJobs.location,
+    "employer": EmployerJobs.employer_id,
+}
+
+def job_facets(db: Session, filters):
+    """
+    Count the jobs matching `filters` per facet value in a single grouped
+    aggregate (GROUPING SETS), so no job rows are loaded. Empty values are
+    left out and each facet is ordered by count, highest first.
+    """
+    groupings = [func.grouping(column).label(f"grouping_{name}") for name, column in FACET_COLUMNS.items()]
+    query = (
+        select(*FACET_COLUMNS.values(), Employer.name, *groupings, func.count().label("count"))
+        .select_from(EmployerJobs)
+        .join(Employer, Employer.id == EmployerJobs.employer_id)
+        .where(*filters)
+        .group_by(func.grouping_sets(
+            *[tuple_(column) for name, column in FACET_COLUMNS.items() if name != "employer"],
+            tuple_(EmployerJobs.employer_id, Employer.name),
+        ))
+        .order_by(func.count().desc())
+    )
+
+    result = {name: [] for name in FACET_COLUMNS}
+    for row in db.execute(query).mappings():
+        # grouping() is 0 for the column the row was grouped by
+        name = next(name for name in FACET_COLUMNS if row[f"grouping_{name}"] == 0)
+        value = row[FACET_COLUMNS[name]]
+        if value in (None, ""):
+            continue
+        if name == "employer":
+            result[name].append({"id": value, "name": row[Employer.name] or "", "count": row["count"]})
+        else:
+            result[name].append({"value": value, "count": row["count"]})
+    return result
 
 '''
 
@@ -185,75 +383,6 @@ def get_jobs_by_employer(employer_id: int, db: Session = Depends(get_db)):
         "jobs": jobs_data
     }
 
-@router.post("/search")
-def search_jobs(
-    search_term: str = "",
-    jobtype: Optional[str] = None,
-    workmode: Optional[str] = None,
-    level: Optional[str] = None,
-    location: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
-    """
-    Search job listings with various filters
-    """
-    query = db.query(EmployerJobs).join(Employer)  # Join with Employer table
-    
-    if search_term:
-        search = f"%{search_term}%"
-        query = query.filter(
-            (EmployerJobs.name.ilike(search)) |
-            (EmployerJobs.description.ilike(search)) |
-            (EmployerJobs.summary.ilike(search))
-        )
-    
-    if jobtype:
-        query = query.filter(EmployerJobs.jobtype == jobtype)
-    
-    if workmode:
-        query = query.filter(EmployerJobs.workmode == workmode)
-    
-    if level:
-        query = query.filter(EmployerJobs.level == level)
-    
-    if location:
-        query = query.filter(EmployerJobs.location.ilike(f"%{location}%"))
-    
-    jobs = query.all()
-    
-    # Convert to dictionaries and handle None values
-    jobs_data = []
-    for job in jobs:
-        job_dict = {
-            "id": job.id or 0,
-            "employer_id": job.employer_id or 0,
-            "name": job.name or "",
-            "description": job.description or "",
-            "desc_json": job.desc_json or "",
-            "summary": job.summary or "",
-            "responsibilities": job.responsibilities or "",
-            "qualifications": job.qualifications or "",
-            "skills": job.skills or "",
-            "experience": job.experience or "",
-            "experienceyear": job.experienceyear or "",
-            "postedtime": job.postedtime or "",
-            "jobtype": job.jobtype or "",
-            "workmode": job.workmode or "",
-            "level": job.level or "",
-            "location": job.location or "",
-            "employer": {
-                "id": job.employer.id or 0,
-                "name": job.employer.name or "",
-                "info": job.employer.info or "",
-                "logo": job.employer.logo or "",
-                "location": job.employer.location or "",
-                "businessnature": job.employer.businessnature or ""
-            }
-        }
-        jobs_data.append(job_dict)
-    
-    return jobs_data
-
 @router.post("/")
 def create_job(
     employer_id: int,
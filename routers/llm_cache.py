@@ -0,0 +1,248 @@
+from sqlalchemy import select, delete, func
+from db.db_connection import SessionLocal, AsyncSessionLocal
+from db.crud import upsert_many, async_upsert_many
+from db.cache import MemoryCacheBackend
+from db.models.llm import LLMResponse
+from datetime import datetime, timedelta, timezone
+import asyncio, copy, hashlib, json, os, threading, time
+
+# Cache in front of the evaluators' LLM chains. An output is keyed on the
+# model, the evaluator's prompt version and the fully rendered prompt, so the
+# same prompt never reaches Gemini twice within LLM_CACHE_TTL:
+#   - an in-process TTL + LRU tier of LLM_CACHE_MAX_ENTRIES,
+#   - the llm_responses table, shared by every worker and kept across restarts,
+#   - concurrent identical calls in one process share a single request.
+# LLM_CACHE: "postgres" (default), "memory" (no table) or "none".
+LLM_CACHE = os.getenv("LLM_CACHE", "postgres").lower()
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 86400))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024))
+
+# expired rows are deleted after every PURGE_EVERY stored outputs
+PURGE_EVERY = 100
+
+memory = MemoryCacheBackend(max_entries=LLM_CACHE_MAX_ENTRIES) if LLM_CACHE != "none" else None
+
+# cache key -> future of the call in progress
+inflight = {}
+
+# evaluator -> counters, served at /metrics/llm. llm_ms is the time spent in
+# Gemini, saved_ms the original time of every call answered from the cache.
+llm_stats = {}
+stats_lock = threading.Lock()
+stores_since_purge = 0
+
+
+def evaluator_stats(evaluator: str) -> dict:
+    return llm_stats.setdefault(evaluator, {
+        "calls": 0, "memory_hits": 0, "db_hits": 0, "shared": 0, "errors": 0,
+        "llm_ms": 0.0, "saved_ms": 0.0, "prompt_chars": 0, "output_chars": 0
+    })
+
+
+def count(evaluator: str, **increments):
+    with stats_lock:
+        stats = evaluator_stats(evaluator)
+        for name, value in increments.items():
+            stats[name] += value
+
+
+def llm_cache_stats() -> dict:
+    evaluators = {}
+    for evaluator, stats in list(llm_stats.items()):
+        hits = stats["memory_hits"] + stats["db_hits"] + stats["shared"]
+        lookups = hits + stats["calls"]
+        evaluators[evaluator] = {**stats, "hit_ratio": round(hits / lookups, 3) if lookups else None}
+    return {
+        "backend": LLM_CACHE,
+        "ttl": LLM_CACHE_TTL,
+        "memory_entries": memory.size() if memory else 0,
+        "evaluators": evaluators
+    }
+
+
+def cacheable_output(output):
+    """Chat models return a message, only its text is kept."""
+    return output.content if hasattr(output, "content") else output
+
+
+def cache_key(model: str, prompt_version: str, prompt_text: str) -> str:
+    return hashlib.sha256(json.dumps([model, prompt_version, prompt_text]).encode()).hexdigest()
+
+
+class CachedChain:
+    """
+    Wraps a prompt | llm [| parser] chain with the cache. invoke/ainvoke take
+    the same inputs and return the same output, except that chat messages come
+    back as their text. Raised exceptions are never cached.
+    """
+
+    def __init__(self, evaluator: str, chain, prompt, model: str, prompt_version: str, ttl: int = LLM_CACHE_TTL):
+        self.evaluator = evaluator
+        self.chain = chain
+        self.prompt = prompt
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        evaluator_stats(evaluator)
+
+    def key(self, inputs: dict):
+        prompt_text = self.prompt.format(**inputs)
+        return cache_key(self.model, self.prompt_version, prompt_text), prompt_text
+
+    def from_memory(self, key: str):
+        entry = memory.get(key)
+        if entry is not None:
+            count(self.evaluator, memory_hits=1, saved_ms=entry["cost_ms"])
+            return copy.deepcopy(entry["output"])
+        return None
+
+    def remember(self, key: str, output, cost_ms: float, ttl: float):
+        memory.set(key, {"output": copy.deepcopy(output), "cost_ms": cost_ms}, ttl)
+
+    def lookup_statement(self, key: str):
+        return select(LLMResponse.output, LLMResponse.cost_ms, LLMResponse.expires_at).where(
+            LLMResponse.cache_key == key, LLMResponse.expires_at > func.now()
+        )
+
+    def db_hit(self, key: str, row):
+        count(self.evaluator, db_hits=1, saved_ms=row.cost_ms)
+        remaining = (row.expires_at - datetime.now(timezone.utc)).total_seconds()
+        self.remember(key, row.output, row.cost_ms, min(self.ttl, max(remaining, 1)))
+        return row.output
+
+    def row(self, key: str, output, cost_ms: float) -> dict:
+        return {
+            "cache_key": key,
+            "evaluator": self.evaluator,
+            "model": self.model,
+            "prompt_version": self.prompt_version,
+            "output": output,
+            "cost_ms": cost_ms,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        }
+
+    def record_call(self, key: str, prompt_text: str, output, elapsed_ms: float):
+        count(
+            self.evaluator, calls=1, llm_ms=elapsed_ms, prompt_chars=len(prompt_text),
+            output_chars=len(output if isinstance(output, str) else json.dumps(output, default=str))
+        )
+        self.remember(key, output, elapsed_ms, self.ttl)
+
+    def should_purge(self) -> bool:
+        global stores_since_purge
+        with stats_lock:
+            stores_since_purge += 1
+            if stores_since_purge < PURGE_EVERY:
+                return False
+            stores_since_purge = 0
+            return True
+
+    def invoke(self, inputs: dict):
+        if memory is None:
+            return cacheable_output(self.chain.invoke(inputs))
+
+        key, prompt_text = self.key(inputs)
+        output = self.from_memory(key)
+        if output is not None:
+            return output
+
+        if LLM_CACHE == "postgres":
+            try:
+                with SessionLocal() as db:
+                    row = db.execute(self.lookup_statement(key)).first()
+                if row is not None:
+                    return copy.deepcopy(self.db_hit(key, row))
+            except Exception as e:
+                count(self.evaluator, errors=1)
+                print(f"Error reading LLM cache for {self.evaluator}: {e}")
+
+        start = time.perf_counter()
+        output = cacheable_output(self.chain.invoke(inputs))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.record_call(key, prompt_text, output, elapsed_ms)
+
+        if LLM_CACHE == "postgres":
+            self.store(key, output, elapsed_ms)
+        return output
+
+    def store(self, key: str, output, cost_ms: float):
+        try:
+            with SessionLocal() as db:
+                if isinstance(upsert_many(db, LLMResponse, [self.row(key, output, cost_ms)], ["cache_key"]), dict):
+                    count(self.evaluator, errors=1)
+                elif self.should_purge():
+                    db.execute(delete(LLMResponse).where(LLMResponse.expires_at < func.now()))
+                    db.commit()
+        except Exception as e:
+            count(self.evaluator, errors=1)
+            print(f"Error writing LLM cache for {self.evaluator}: {e}")
+
+    async def ainvoke(self, inputs: dict):
+        if memory is None:
+            return cacheable_output(await self.chain.ainvoke(inputs))
+
+        key, prompt_text = self.key(inputs)
+        output = self.from_memory(key)
+        if output is not None:
+            return output
+
+        # an identical call is already running, wait for its output
+        while (running := inflight.get(key)) is not None:
+            try:
+                output = await asyncio.shield(running)
+            except asyncio.CancelledError:
+                # Only the call we waited on was cancelled (its request went
+                # away): join the next one or make the call ourselves.
+                if running.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            count(self.evaluator, shared=1)
+            return copy.deepcopy(output)
+
+        future = asyncio.get_running_loop().create_future()
+        inflight[key] = future
+        try:
+            output = await self.acall(key, prompt_text, inputs)
+            future.set_result(output)
+            return copy.deepcopy(output)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters get it, an unawaited future must not warn
+            raise
+        finally:
+            inflight.pop(key, None)
+
+    async def acall(self, key: str, prompt_text: str, inputs: dict):
+        if LLM_CACHE == "postgres":
+            try:
+                async with AsyncSessionLocal() as db:
+                    row = (await db.execute(self.lookup_statement(key))).first()
+                if row is not None:
+                    return self.db_hit(key, row)
+            except Exception as e:
+                count(self.evaluator, errors=1)
+                print(f"Error reading LLM cache for {self.evaluator}: {e}")
+
+        start = time.perf_counter()
+        output = cacheable_output(await self.chain.ainvoke(inputs))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.record_call(key, prompt_text, output, elapsed_ms)
+
+        if LLM_CACHE == "postgres":
+            await self.astore(key, output, elapsed_ms)
+        return output
+
+    async def astore(self, key: str, output, cost_ms: float):
+        try:
+            async with AsyncSessionLocal() as db:
+                if isinstance(await async_upsert_many(db, LLMResponse, [self.row(key, output, cost_ms)], ["cache_key"]), dict):
+                    count(self.evaluator, errors=1)
+                elif self.should_purge():
+                    await db.execute(delete(LLMResponse).where(LLMResponse.expires_at < func.now()))
+                    await db.commit()
+        except Exception as e:
+            count(self.evaluator, errors=1)
+            print(f"Error writing LLM cache for {self.evaluator}: {e}")
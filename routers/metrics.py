@@ -0,0 +1,56 @@
+from fastapi import APIRouter
+from db.db_connection import pool_stats
+from db.cache import cache_stats
+from db.models.base import serialization_stats
+from routers.evaluators import get_behavior_evaluator
+from routers.guidelines import guideline_stats
+from routers.llm_cache import llm_cache_stats
+from routers.resume_evaluator import pdf_stats, extraction_cache_stats, PDF_POOL_WORKERS, PDF_MAX_PAGES, PDF_PARSE_TIMEOUT
+
+router = APIRouter()
+
+@router.get("/pool")
+def get_pool_stats():
+    """Connection pool usage: checked-out connections, overflow and checkout wait time."""
+    return pool_stats()
+
+@router.get("/cache")
+def get_cache_stats():
+    """Response cache hits, misses and invalidations per cached route."""
+    return cache_stats()
+
+@router.get("/serialization")
+def get_serialization_stats():
+    """Responses built through model_response: count, total/max milliseconds and bytes per schema."""
+    return serialization_stats
+
+@router.get("/pdf")
+def get_pdf_stats():
+    """Resume PDF parsing: files, pages, bytes and parse time, with the pool limits."""
+    return {
+        "workers": PDF_POOL_WORKERS,
+        "max_pages": PDF_MAX_PAGES,
+        "timeout": PDF_PARSE_TIMEOUT,
+        **pdf_stats
+    }
+
+@router.get("/extractions")
+def get_extraction_stats():
+    """Resume extraction cache: hits, misses, hit ratio and the parse + LLM time hits saved."""
+    return extraction_cache_stats()
+
+@router.get("/guidelines")
+def get_guideline_stats():
+    """Guideline retrieval: backend, index size and age, searches and their time in microseconds."""
+    return {**get_behavior_evaluator().retriever.stats(), **guideline_stats}
+
+@router.get("/embeddings")
+def get_embedding_stats():
+    """Query embedding cache: memory and disk hits, misses, batched calls and their time."""
+    embeddings = get_behavior_evaluator().embeddings
+    return embeddings.stats() if hasattr(embeddings, "stats") else {}
+
+@router.get("/llm")
+def get_llm_stats():
+    """LLM response cache per evaluator: Gemini calls and time, hits per tier and the time they saved."""
+    return llm_cache_stats()
@@ -0,0 +1,35 @@
+from pypdf import PdfReader
+from io import BytesIO
+import signal, time
+
+# Runs in the PDF pool workers (see routers.resume_evaluator). Kept apart from
+# the app modules so a worker only has to import pypdf.
+
+class PdfParseTimeout(Exception):
+    pass
+
+def raise_parse_timeout(signum, frame):
+    raise PdfParseTimeout()
+
+def extract_pdf_text(contents: bytes, max_pages: int, timeout: float) -> dict:
+    """
+    Runs in a pool worker. SIGALRM aborts the parse inside the worker, so a
+    pathological file cannot keep a worker busy after the caller gave up.
+    """
+    start = time.perf_counter()
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, raise_parse_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        reader = PdfReader(BytesIO(contents))
+        page_count = len(reader.pages)
+        text = "".join(page.extract_text() or "" for page in reader.pages[:max_pages])
+    finally:
+        if hasattr(signal, "SIGALRM"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return {
+        "text": text,
+        "pages": page_count,
+        "parsed_pages": min(page_count, max_pages),
+        "parse_ms": (time.perf_counter() - start) * 1000,
+    }
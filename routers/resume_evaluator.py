@@ -2,10 +2,89 @@ from fastapi import HTTPException
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_google_genai import GoogleGenerativeAI
-from db.models.user import ResumeReport
-from pypdf import PdfReader
-from io import BytesIO
-import json, os
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from db.crud import async_upsert_many
+from db.models.user import ResumeReport, ResumeExtraction
+from .pdf_text import PdfParseTimeout, extract_pdf_text
+from concurrent.futures import ProcessPoolExecutor
+import asyncio, hashlib, json, multiprocessing, os, threading, time
+
+# PDF text extraction is CPU bound, so it runs in a small process pool instead
+# of on the event loop. Only the first PDF_MAX_PAGES pages are read, and a
+# parse that takes longer than PDF_PARSE_TIMEOUT seconds is aborted. Workers
+# come from a forkserver: forking the server itself, with its threadpool and
+# database/gRPC client threads, could leave a child stuck on a lock.
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", 2))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 20))
+PDF_PARSE_TIMEOUT = float(os.getenv("PDF_PARSE_TIMEOUT", 20))
+
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+
+# Served at /metrics/pdf to size the pool and the limits above
+pdf_stats = {"files": 0, "failures": 0, "timeouts": 0, "truncated": 0, "pages": 0, "bytes": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+def start_pdf_pool() -> ProcessPoolExecutor:
+    """Creates the pool, called on app startup; scripts get one on first use."""
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["routers.pdf_text"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS, mp_context=context)
+        return pdf_pool
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    return pdf_pool or start_pdf_pool()
+
+def shutdown_pdf_pool():
+    """Stops the pool workers, called on app shutdown."""
+    global pdf_pool
+    with pdf_pool_lock:
+        if pdf_pool is not None:
+            pdf_pool.shutdown(wait=False, cancel_futures=True)
+            pdf_pool = None
+
+def record_pdf_stats(size: int, result: dict = None, failed: bool = False, timed_out: bool = False):
+    pdf_stats["files"] += 1
+    pdf_stats["bytes"] += size
+    if failed:
+        pdf_stats["failures"] += 1
+    if timed_out:
+        pdf_stats["timeouts"] += 1
+    if result:
+        pdf_stats["pages"] += result["parsed_pages"]
+        pdf_stats["truncated"] += result["pages"] > result["parsed_pages"]
+        pdf_stats["total_ms"] += result["parse_ms"]
+        pdf_stats["max_ms"] = max(pdf_stats["max_ms"], result["parse_ms"])
+
+async def read_pdf_text(contents: bytes) -> dict:
+    """
+    Extracts the text of a PDF in the process pool without blocking the event
+    loop. Returns {"text", "pages", "parsed_pages", "parse_ms"}.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        # the worker enforces the timeout itself, this one also covers queueing
+        # behind other uploads
+        result = await asyncio.wait_for(
+            loop.run_in_executor(get_pdf_pool(), extract_pdf_text, contents, PDF_MAX_PAGES, PDF_PARSE_TIMEOUT),
+            timeout=PDF_PARSE_TIMEOUT * 2
+        )
+    except (PdfParseTimeout, asyncio.TimeoutError):
+        record_pdf_stats(len(contents), failed=True, timed_out=True)
+        raise HTTPException(status_code=400, detail=f"Error reading PDF: parsing took longer than {PDF_PARSE_TIMEOUT:g}s")
+    except Exception as e:
+        record_pdf_stats(len(contents), failed=True)
+        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+
+    record_pdf_stats(len(contents), result)
+    print(f"Parsed PDF: {result['parsed_pages']}/{result['pages']} pages, {len(contents)} bytes in {result['parse_ms']:.0f} ms")
+    return result
 
 def replace_nulls(obj):
     """Recursively replace None values with an empty string in a dictionary or list."""
@@ -17,10 +96,71 @@ def replace_nulls(obj):
         return ""
     return obj
 
+# Extractions are cached in resume_extractions by file content, so re-uploading
+# the same PDF skips both the parse and the LLM call. Bump
+# RESUME_PROMPT_VERSION whenever the prompt or the result shape changes; older
+# entries are then simply never read again.
+RESUME_MODEL = "gemini-1.5-flash"
+RESUME_PROMPT_VERSION = "1"
+
+# Served at /metrics/extractions; saved_ms adds up the original cost of every hit
+extraction_stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0, "saved_ms": 0.0, "miss_ms": 0.0}
+
+def resume_content_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+async def get_cached_extraction(db: AsyncSession, content_hash: str):
+    """The cached extraction of a file, or None. Cache errors count as a miss."""
+    try:
+        row = (await db.execute(
+            select(ResumeExtraction.result, ResumeExtraction.cost_ms).where(
+                ResumeExtraction.content_hash == content_hash,
+                ResumeExtraction.prompt_version == RESUME_PROMPT_VERSION,
+                ResumeExtraction.model == RESUME_MODEL
+            )
+        )).first()
+    except Exception as e:
+        await db.rollback()
+        print(f"Error reading resume extraction cache: {e}")
+        extraction_stats["errors"] += 1
+        row = None
+
+    if row is None:
+        extraction_stats["misses"] += 1
+        return None
+    extraction_stats["hits"] += 1
+    extraction_stats["saved_ms"] += row.cost_ms
+    print(f"Resume extraction cache hit for {content_hash[:12]}, saved {row.cost_ms:.0f} ms")
+    return row.result
+
+async def store_extraction(db: AsyncSession, content_hash: str, result: dict, cost_ms: float):
+    stored = await async_upsert_many(db, ResumeExtraction, [{
+        "content_hash": content_hash,
+        "prompt_version": RESUME_PROMPT_VERSION,
+        "model": RESUME_MODEL,
+        "result": result,
+        "cost_ms": cost_ms
+    }], ["content_hash", "prompt_version", "model"])
+    if isinstance(stored, dict):
+        extraction_stats["errors"] += 1
+        return
+    extraction_stats["stores"] += 1
+    extraction_stats["miss_ms"] += cost_ms
+
+def extraction_cache_stats() -> dict:
+    lookups = extraction_stats["hits"] + extraction_stats["misses"]
+    return {
+        "model": RESUME_MODEL,
+        "prompt_version": RESUME_PROMPT_VERSION,
+        "hit_ratio": round(extraction_stats["hits"] / lookups, 3) if lookups else None,
+        **extraction_stats
+    }
+
 class ResumeEvaluator:
-    def __init__(self):
-        self.llm = GoogleGenerativeAI(
-            model='gemini-1.5-flash',
+    def __init__(self, llm: GoogleGenerativeAI = None):
+        # pass `llm` to share a client, see routers.evaluators
+        self.llm = llm if llm is not None else GoogleGenerativeAI(
+            model=RESUME_MODEL,
             temperature=0,
             api_key=os.getenv("GOOGLE_API_KEY")
         )
@@ -42,44 +182,55 @@ class ResumeEvaluator:
             input_variables=["text"]
         )
 
-    def read_pdf_file(self, file_contents: BytesIO) -> str:
-        """Extract text content from a PDF file."""
-        try:
-            pdf_reader = PdfReader(file_contents)
-            text = ''
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+        # not a CachedChain: results are already cached by file content in
+        # resume_extractions, see evaluate_resume and routers.resume_pipeline
+        self.chain = (
+            self.evaluation_prompt
+            | self.llm
+            | JsonOutputParser(pydantic_object=ResumeReport)
+        )
 
-    async def evaluate_resume(self, file_contents: BytesIO) -> dict:
-        """Evaluate a resume and extract structured information."""
+    async def read_pdf_file(self, file_contents: bytes) -> str:
+        """Extract text content from a PDF file, see read_pdf_text."""
+        return (await read_pdf_text(file_contents))["text"]
+
+    async def evaluate_resume(self, file_contents: bytes, db: AsyncSession = None) -> dict:
+        """
+        Evaluate a resume and extract structured information. With a `db`
+        session the result is read from and stored in the extraction cache.
+        """
+        content_hash = resume_content_hash(file_contents)
+        if db is not None:
+            cached = await get_cached_extraction(db, content_hash)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        # Extract text from PDF
+        text = await self.read_pdf_file(file_contents)
+        result = await self.evaluate_text(text)
+
+        if db is not None:
+            await store_extraction(db, content_hash, result, (time.perf_counter() - start) * 1000)
+        return result
+
+    async def evaluate_text(self, text: str) -> dict:
+        """Extract structured information from the text of a resume."""
         try:
-            # Extract text from PDF
-            text = self.read_pdf_file(file_contents)
-
-            # Create the chain correctly
-            chain = (
-                self.evaluation_prompt 
-                | self.llm 
-                | JsonOutputParser(pydantic_object=ResumeReport)
-            )
-            
             # Invoke chain with the text
-            response = await chain.ainvoke({"text": text})
+            response = await self.chain.ainvoke({"text": text})
             
             # Process the response
             processed_response = replace_nulls(response)
             
             return {
-                "base64_string": json.dumps(processed_response, indent=2),
+                "base64_string": processed_response,
                 "name": response.get('name', '-'),
                 "position": response.get('job_position', '-'),
                 "location": response.get('address', '-'),
-                "experience": json.dumps(response.get('experience', '-')),
-                "education": json.dumps(response.get('education', '-')),
-                "jobs": json.dumps(response.get('jobs', '-')),
+                "experience": response.get('experience', '-'),
+                "education": response.get('education', '-'),
+                "jobs": response.get('jobs', '-'),
                 "skills": response.get('skills', [])
             }
             
@@ -0,0 +1,182 @@
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_, func, text
+from db.db_connection import AsyncSessionLocal
+from db.crud import async_get_data, async_update_data, async_upsert_many
+from db.models.user import User, UserSkills, ResumeJob
+from db.models.loading import load_profile
+from .resume_evaluator import read_pdf_text, resume_content_hash, get_cached_extraction, store_extraction
+from .evaluators import get_resume_evaluator
+import asyncio, os, time
+
+# Background processing of resumes uploaded with background=true. Jobs are
+# durable rows in resume_jobs; the in-process queue only carries their ids.
+# Unfinished jobs are queued again at startup, and every instance sweeps for
+# jobs idle for longer than RESUME_JOB_STALE_SECONDS (e.g. left behind by an
+# instance that crashed or scaled down) every RESUME_JOB_STALE_SECONDS / 2.
+RESUME_WORKERS = int(os.getenv("RESUME_WORKERS", 1))
+RESUME_JOB_MAX_ATTEMPTS = int(os.getenv("RESUME_JOB_MAX_ATTEMPTS", 3))
+RESUME_JOB_STALE_SECONDS = int(os.getenv("RESUME_JOB_STALE_SECONDS", 600))
+
+FINISHED_STATUSES = ("done", "failed")
+
+resume_queue = asyncio.Queue()
+resume_workers = []
+
+
+async def save_resume_skills(db: AsyncSession, email: str, skills: list):
+    """Adds the extracted skills (level 0) and keeps the level of existing ones."""
+    if not skills:
+        return  # No skills to update
+
+    user_id = (await async_get_data(db, User, {"email": email}, options=load_profile(User, "minimal")))[0].id
+
+    await async_upsert_many(db, UserSkills, [
+        {"user_id": user_id, "name": skill_name, "level": "0"}
+        for skill_name in dict.fromkeys(skills)
+    ], ["user_id", "name"], update_columns=[])
+
+
+async def save_resume_profile(db: AsyncSession, email: str, filename: str, result: dict):
+    """Stores the extracted resume fields on the user."""
+    return await async_update_data(db, User, {"email": email}, {
+        "name": result["name"],
+        "resume": filename,
+        "resume_base64": result["base64_string"],
+        "position": result["position"],
+        "location": result["location"],
+        "experience": result["experience"],
+        "education": result["education"],
+        "jobs": result["jobs"]
+    })
+
+
+async def set_job_state(db: AsyncSession, job_id: int, **values):
+    await db.execute(update(ResumeJob).where(ResumeJob.id == job_id).values(updated_at=func.now(), **values))
+    await db.commit()
+
+
+async def claim_job(db: AsyncSession, job_id: int) -> bool:
+    """
+    Marks the job as parsing unless another worker has it. Queued jobs, and
+    unfinished ones idle for longer than RESUME_JOB_STALE_SECONDS, can be claimed.
+    """
+    stale = func.now() - text(f"interval '{RESUME_JOB_STALE_SECONDS} seconds'")
+    claimed = await db.execute(
+        update(ResumeJob)
+        .where(
+            ResumeJob.id == job_id,
+            or_(
+                ResumeJob.status == "queued",
+                and_(ResumeJob.status.notin_(FINISHED_STATUSES), ResumeJob.updated_at < stale),
+            )
+        )
+        .values(status="parsing", attempts=ResumeJob.attempts + 1, updated_at=func.now())
+        .returning(ResumeJob.id)
+    )
+    await db.commit()
+    return claimed.first() is not None
+
+
+async def process_resume_job(job_id: int):
+    async with AsyncSessionLocal() as db:
+        if not await claim_job(db, job_id):
+            return
+
+        job = (await db.execute(
+            select(ResumeJob.pdf, ResumeJob.filename, ResumeJob.attempts, User.email)
+            .join(User, User.id == ResumeJob.user_id)
+            .where(ResumeJob.id == job_id)
+        )).one()
+
+        try:
+            content_hash = resume_content_hash(job.pdf)
+            result = await get_cached_extraction(db, content_hash)
+            if result is not None:
+                await set_job_state(db, job_id, status="extracted", progress={"cached": True})
+            else:
+                start = time.perf_counter()
+                parsed = await read_pdf_text(job.pdf)
+                progress = {"pages": parsed["pages"], "parsed_pages": parsed["parsed_pages"], "parse_ms": round(parsed["parse_ms"])}
+                await set_job_state(db, job_id, status="parsed", progress=progress)
+
+                result = await get_resume_evaluator().evaluate_text(parsed["text"])
+                await store_extraction(db, content_hash, result, (time.perf_counter() - start) * 1000)
+                await set_job_state(db, job_id, status="extracted")
+
+            await save_resume_skills(db, job.email, result["skills"])
+            await set_job_state(db, job_id, status="skills_saved")
+
+            if not await save_resume_profile(db, job.email, job.filename, result):
+                raise Exception("Failed to update user information")
+            await set_job_state(db, job_id, status="done", result=result, error=None, pdf=None)
+            print(f"Resume job {job_id} done")
+
+        except Exception as e:
+            await db.rollback()
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            # a file that cannot be parsed will not parse on a retry either
+            retry = job.attempts < RESUME_JOB_MAX_ATTEMPTS and not (isinstance(e, HTTPException) and e.status_code == 400)
+            print(f"Error in resume job {job_id} (attempt {job.attempts}): {error}")
+            await set_job_state(db, job_id, status="queued" if retry else "failed", error=error)
+            if retry:
+                # back off 10s, 20s, ... so a flaky LLM call gets some room
+                asyncio.get_running_loop().call_later(10 * job.attempts, enqueue_resume_job, job_id)
+
+
+async def resume_worker():
+    while True:
+        job_id = await resume_queue.get()
+        try:
+            await process_resume_job(job_id)
+        except Exception as e:
+            print(f"Error in resume worker for job {job_id}: {e}")
+        finally:
+            resume_queue.task_done()
+
+
+def enqueue_resume_job(job_id: int):
+    resume_queue.put_nowait(job_id)
+
+
+async def requeue_unfinished_jobs(idle_seconds: int = 0) -> int:
+    """
+    Queues the unfinished jobs idle for at least `idle_seconds`. A job another
+    instance is still working on is skipped by claim_job.
+    """
+    query = select(ResumeJob.id).where(ResumeJob.status.notin_(FINISHED_STATUSES))
+    if idle_seconds:
+        query = query.where(ResumeJob.updated_at < func.now() - text(f"interval '{idle_seconds} seconds'"))
+    try:
+        async with AsyncSessionLocal() as db:
+            job_ids = (await db.execute(query.order_by(ResumeJob.id))).scalars().all()
+    except Exception as e:
+        print(f"Error recovering resume jobs: {e}")
+        return 0
+    for job_id in job_ids:
+        enqueue_resume_job(job_id)
+    return len(job_ids)
+
+
+async def sweep_stale_jobs():
+    """Re-queues jobs whose instance stopped working on them, see claim_job."""
+    while True:
+        await asyncio.sleep(RESUME_JOB_STALE_SECONDS / 2)
+        requeued = await requeue_unfinished_jobs(RESUME_JOB_STALE_SECONDS)
+        if requeued:
+            print(f"Re-queued {requeued} stale resume jobs")
+
+
+async def start_resume_workers():
+    """Starts the workers and the stale job sweep, and re-queues jobs left unfinished by a previous instance."""
+    for _ in range(RESUME_WORKERS):
+        resume_workers.append(asyncio.create_task(resume_worker()))
+    resume_workers.append(asyncio.create_task(sweep_stale_jobs()))
+    await requeue_unfinished_jobs()
+
+
+async def stop_resume_workers():
+    for worker in resume_workers:
+        worker.cancel()
+    await asyncio.gather(*resume_workers, return_exceptions=True)
+    resume_workers.clear()
@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from db.db_connection import get_db
 from db.crud import *
+from db.migrations import run_migrations, migration_status
+from db.etag import check_etag_support
 from db.models.skill_assess import Skill_assess, SkillType
 from db.models.employer import Employer, EmployerJobs
 from typing import List
@@ -9,6 +11,7 @@ import json
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import GoogleGenerativeAI
+from .llm_cache import CachedChain
 import os
 from dotenv import load_dotenv
 
@@ -46,6 +49,10 @@ prompt = PromptTemplate(
     partial_variables={"format_instructions": parser.get_format_instructions()}
 )
 
+# bump when the prompt or the parsing changes, see routers.llm_cache
+JOB_PARSER_PROMPT_VERSION = "1"
+job_parser = CachedChain("job_parser", prompt | llm | parser, prompt, llm.model, JOB_PARSER_PROMPT_VERSION)
+
 @router.post("/upload-company-info")
 def upload_company_info(db: Session = Depends(get_db)):
     records = [
@@ -406,28 +413,30 @@ def upload_company_info(db: Session = Depends(get_db)):
         }
     ]
 
-    inserted_records = []
+    job_listings_by_company = {record["name"]: record.pop("job_listings", []) for record in records}
+
+    # Look up every existing company in one query and insert the missing ones in one batch
+    employer_ids = {
+        name: employer_id for employer_id, name in
+        db.query(Employer.id, Employer.name).filter(Employer.name.in_(job_listings_by_company.keys())).all()
+    }
+    for name in employer_ids:
+        print(f"Company {name} already exists, using existing ID: {employer_ids[name]}")
+
+    new_records = [record for record in records if record["name"] not in employer_ids]
+    new_ids = insert_many(db, Employer, new_records)
+    if isinstance(new_ids, dict):
+        raise HTTPException(status_code=400, detail=new_ids["error"])
+    for record, employer_id in zip(new_records, new_ids):
+        employer_ids[record["name"]] = employer_id
+        print(f"Inserted new company {record['name']} with ID: {employer_id}")
+
+    jobs_data = []
     for record in records:
-        job_listings = record.pop("job_listings", [])
-        
-        # Check if employer already exists
-        existing_employer = db.query(Employer).filter(Employer.name == record["name"]).first()
-        
-        if existing_employer:
-            employer_id = existing_employer.id
-            employer_result = existing_employer
-            print(f"Company {record['name']} already exists, using existing ID: {employer_id}")
-        else:
-            employer_result = insert_data(db, Employer, record)
-            if not employer_result:
-                print(f"Failed to insert company {record['name']}")
-                continue
-            employer_result = db.query(Employer).filter(Employer.name == record["name"]).first()
-            employer_id = employer_result.id
-            print(f"Inserted new company {record['name']} with ID: {employer_id}")
-            
-        # Insert jobs for this employer
-        for job in job_listings:
+        employer_id = employer_ids[record["name"]]
+
+        # Parse jobs for this employer
+        for job in job_listings_by_company[record["name"]]:
             try:
                 # Use summary as description for LLM parsing
                 job_description = job.get("summary", "")
@@ -435,27 +444,18 @@ def upload_company_info(db: Session = Depends(get_db)):
                     print(f"Skipping job {job['name']} - no description/summary found")
                     continue
 
-                # Use LLM to parse job description
-                chain = prompt | llm | parser
-                desc_json = chain.invoke({"description": job_description})
+                # Use LLM to parse job description, repeated descriptions come from the cache
+                desc_json = job_parser.invoke({"description": job_description})
                 
-                job_data = {
+                jobs_data.append({
                     "employer_id": employer_id,
                     "name": job["name"],
                     "description": job_description,
-                    "desc_json": json.dumps(desc_json, ensure_ascii=False, indent=2),
+                    "desc_json": desc_json,
                     "summary": job.get("summary", ""),
-                    "responsibilities": json.dumps(job.get("responsibilities", []), 
-                        ensure_ascii=False, 
-                        indent=2,
-                        separators=(',', ': ')
-                    ),
+                    "responsibilities": job.get("responsibilities", []),
                     "qualifications": job.get("qualifications", ""),
-                    "skills": json.dumps(job.get("skills", []),
-                        ensure_ascii=False,
-                        indent=2,
-                        separators=(',', ': ')
-                    ),
+                    "skills": job.get("skills", []),
                     "experience": job.get("experience", ""),
                     "experienceyear": job.get("experienceyear", ""),
                     "postedtime": job.get("postedTime", ""),
@@ -463,46 +463,30 @@ def upload_company_info(db: Session = Depends(get_db)):
                     "workmode": job.get("workMode", ""),
                     "level": job.get("level", ""),
                     "location": job.get("location", "")
-                }
-                
-                job_result = insert_data(db, EmployerJobs, job_data)
-                if job_result:
-                    job_obj = db.query(EmployerJobs).filter(
-                        EmployerJobs.employer_id == employer_id,
-                        EmployerJobs.name == job["name"]
-                    ).first()
-                    employer_result.jobs.append(job_obj)
-                    print(f"Added job {job['name']} to employer {record['name']}")
+                })
+                print(f"Parsed job {job['name']} for employer {record['name']}")
             except Exception as e:
                 print(f"Error processing job {job['name']}: {str(e)}")
                 continue
-                
-        inserted_records.append(employer_result)
+
+    # Insert every parsed job in one batch
+    job_ids = insert_many(db, EmployerJobs, jobs_data)
+    if isinstance(job_ids, dict):
+        raise HTTPException(status_code=400, detail=job_ids["error"])
 
     return "{'ok'}"
 
 
 
 @router.post("/modify-table")
-def modify_table(db: Session = Depends(get_db)):    
-    add_columns_to_table(db, "employer_jobs", {
-        "summary": "TEXT",
-        "responsibilities": "TEXT",
-        "qualifications": "TEXT",
-        "skills": "TEXT",
-        "experience": "TEXT",
-        "experienceyear": "TEXT",
-        "postedtime": "TEXT",
-        "jobtype": "TEXT",
-        "workmode": "TEXT",
-        "level": "TEXT",
-        "location": "TEXT"
-    })
-
-    add_columns_to_table(db, "employers", {
-        "location": "TEXT",
-        "businessnature": "TEXT"
-    })
+def modify_table():
+    """Applies pending schema migrations, see db/migrations.py."""
+    try:
+        applied = run_migrations()
+        check_etag_support()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Migration failed: {str(e)}")
+    return {"applied": applied, "migrations": migration_status()}
 
 '''
 
@@ -5,8 +5,11 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field, ValidationError
+from .llm_cache import CachedChain
 
-# Initialize Google Generative AI model
+SKILLSET_MODEL = "gemini-1.5-flash"
+# bump when the prompt or the parsing changes, see routers.llm_cache
+SKILLSET_PROMPT_VERSION = "1"
 
 # --- Pydantic Model ---
 class AssessmentQuestion(BaseModel):
@@ -19,17 +22,18 @@ class AssessmentQuestion(BaseModel):
 
 
 class SkillsetGenerator:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
+    def __init__(self, llm: ChatGoogleGenerativeAI = None):
+        # pass `llm` to share a client, see routers.evaluators
+        self.llm = llm if llm is not None else ChatGoogleGenerativeAI(
+            model=SKILLSET_MODEL,
             temperature=0,
             api_key=os.getenv("GOOGLE_API_KEY")
         )
 
-    def generate(self, topics: List[Dict[str, int]], num_questions: int):
-        try:
-            # --- Prompt Template ---
-            prompt_template = """
+        # --- Prompt Template ---
+        self.prompt = PromptTemplate(
+            input_variables=["num_questions", "topic_level_pairs"],
+            template="""
             Let me show you how I create skill assessment questions step by step:
 
             Question: What is the correct file extension for Python files?
@@ -49,7 +53,15 @@ class SkillsetGenerator:
             - Example: ["A: Choice 1", "B: Choice 2", "C: Choice 3", "D: Choice 4"]
             - Generate only {num_questions} questions in total of all topics.
             """
+        )
+        self.chain = CachedChain(
+            "skillset",
+            self.prompt | self.llm | JsonOutputParser(pydantic_object=AssessmentQuestion),
+            self.prompt, self.llm.model, SKILLSET_PROMPT_VERSION
+        )
 
+    def generate(self, topics: List[Dict[str, int]], num_questions: int):
+        try:
             topic_level_pairs = ""
             for topic_info in topics:
                 topic = topic_info["topic"]
@@ -58,12 +70,7 @@ class SkillsetGenerator:
                 for level in range(level_min, level_max + 1):
                     topic_level_pairs += f"Topic: {topic}, Level: {level}\n"
 
-            prompt_str = prompt_template.format(num_questions=num_questions, topic_level_pairs=topic_level_pairs)
-            # print(prompt_str)
-
-            # Create chain
-            chain = PromptTemplate(template=prompt_str) | self.llm | JsonOutputParser(pydantic_object=AssessmentQuestion)
-            response = chain.invoke({})
+            response = self.chain.invoke({"num_questions": num_questions, "topic_level_pairs": topic_level_pairs})
             return response
         except ValidationError as e:
             print(f"Pydantic Validation Error: {e}")
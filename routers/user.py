@@ -1,23 +1,25 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Depends
-from sqlalchemy.orm import Session
-from db.db_connection import get_db
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Query, Header, Response
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from db.db_connection import get_db, get_async_db
 from db.crud import *
-from sqlalchemy.dialects.postgresql import insert  # Required for ON CONFLICT
-from db.models.user import User, UserRegister, UserLogin, UserSchema, UserSkills, UserSkillAssess, UserSkillAssessSchema, UserEmployerJobs, ResumeReport, JobReport
+from db.models.user import User, UserRegister, UserLogin, UserSchema, UserSkills, UserSkillAssess, UserSkillAssessSchema, UserEmployerJobs, ResumeReport, JobReport, UserResponse, ResumeJob, ResumeJobResponse
+from db.models.base import Page, model_response, unpaged_response
 from db.models.employer import Employer, EmployerJobs
-from typing import List, Dict, Optional
+from db.models.loading import load_profile
+from db.etag import row_version, fetch_versions, etags_available, weak_etag, etag_matches, not_modified
+from typing import List, Dict, Optional, Union
 import shutil, os, base64, json
 from io import BytesIO
-from .evaluator import BatchRequest, BatchEvaluationResponse, BehaviorEvaluator
-from .job_evaluator import JobEvaluator
-from .resume_evaluator import ResumeEvaluator
-from .skillset_generator import SkillsetGenerator
+from .evaluator import BatchRequest, BatchEvaluationResponse
+from .evaluators import get_behavior_evaluator, get_job_evaluator, get_resume_evaluator, get_skillset_generator
+from .resume_pipeline import save_resume_skills, save_resume_profile, enqueue_resume_job
 
 from dotenv import load_dotenv
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import GoogleGenerativeAI
-from pypdf import PdfReader
 
 router = APIRouter()
 load_dotenv()
@@ -41,40 +43,34 @@ def update_user_skills(db, email, skills_data):
         return  # No skills to update
     
 
-    user_id = get_data(db, User, {"email": email})[0].id
-
-    # Fetch existing skills for the user
-    existing_skills = {
-        skill.name: skill for skill in db.query(UserSkills).filter(UserSkills.user_id == user_id).all()
-    }
-
-    for skill_name, skill_level in skills_data.items():
-        if skill_name in existing_skills:
-            existing_skills[skill_name].level = skill_level  # Update skill level
-        else:
-            new_skill = UserSkills(user_id=user_id, name=skill_name, level=skill_level)
-            db.add(new_skill)  # Add new skill
+    user_id = get_data(db, User, {"email": email}, options=load_profile(User, "minimal"))[0].id
 
-    db.commit()
+    # Insert new skills and update the level of existing ones in one statement
+    upsert_many(db, UserSkills, [
+        {"user_id": user_id, "name": skill_name, "level": str(skill_level)}
+        for skill_name, skill_level in skills_data.items()
+    ], ["user_id", "name"])
 
 
 
-def read_pdf_file(file_contents: BytesIO):
-    try:
-        pdf_reader = PdfReader(file_contents)
-        text = ''
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
-
-@router.post("/")
-def user_list(db: Session = Depends(get_db)):
-    result = get_data(db, User)
-    if not result:
+@router.post("/", response_model=Union[List[UserResponse], Page[UserResponse]])
+def user_list(
+    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    List users. With `limit`, returns one page as {"items", "next_cursor"};
+    pass `next_cursor` back as `cursor` to get the following page. Without
+    it, at most LIST_MAX_ROWS users as a plain list, with the cursor of the
+    rest in the X-Next-Cursor header.
+    """
+    result = get_data(db, User, limit=limit or LIST_MAX_ROWS, cursor=cursor, options=load_profile(User, "listing"))
+    if not result or (isinstance(result, dict) and "error" in result):
         raise HTTPException(status_code=400, detail=result["error"])
-    return result
+    if limit:
+        return model_response(Page[UserResponse], result)
+    return unpaged_response(List[UserResponse], result)
 
 # register new user
 @router.post("/register")
@@ -87,69 +83,60 @@ def user_register(user_data: UserRegister, db: Session = Depends(get_db)):
 # login
 @router.post("/login")
 def user_login(user_data: UserLogin, db: Session = Depends(get_db)):
-    result = get_data(db, User, user_data.dict())
+    result = get_data(db, User, user_data.dict(), options=load_profile(User, "minimal"))
     if not result:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
-@router.post("/{email}", summary="Get user details")
-def user_get(email: str, db: Session = Depends(get_db)):
-    result = get_data(db, User, {"email": email})
+def user_profile_versions(db: Session, email: str):
+    """Row versions of everything the profile renders, in one query. None for an unknown email."""
+    return fetch_versions(db, [
+        User.updated_at,
+        *row_version(UserSkills, UserSkills.user_id == User.id),
+        *row_version(UserSkillAssess, UserSkillAssess.user_id == User.id),
+        *row_version(UserEmployerJobs, UserEmployerJobs.user_id == User.id),
+        select(func.max(EmployerJobs.updated_at))
+            .join(UserEmployerJobs, UserEmployerJobs.employer_jobs_id == EmployerJobs.id)
+            .where(UserEmployerJobs.user_id == User.id)
+            .scalar_subquery(),
+    ], User.email == email)
+
+@router.get("/{email}", summary="Get user details", response_model=UserResponse)
+@router.post("/{email}", summary="Get user details", response_model=UserResponse)
+def user_get(
+    email: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    The full profile with a weak ETag. A matching If-None-Match is answered
+    with 304 after a single version query, without loading the profile.
+    """
+    versions = user_profile_versions(db, email) if etags_available() else None
+    etag = weak_etag("user", email, *versions) if versions else None
+    if etag and etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    result = get_data(db, User, {"email": email}, options=load_profile(User, "profile"))
     if not result:
         raise HTTPException(status_code=400, detail=result["error"])
     # Return only the first result
     # return result[0]
     user_data = result[0]
-    if user_data.about:
-        try:
-            user_data.about = json.loads(user_data.about)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode 'about' as JSON for user {email}")
-            user_data.about = {}
-    else:
-        user_data.about = {}
-
-    if user_data.jobs:
-        try:
-            user_data.jobs = json.loads(user_data.jobs)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode 'jobs' as JSON for user {email}")
-            user_data.jobs = []
-
-    if user_data.resume_base64:
-        try:
-            user_data.resume_base64 = json.loads(user_data.resume_base64)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode 'resume_base64' as JSON for user {email}")
-            user_data.resume_base64 = []
-
-    if user_data.experience:
-      try:
-        user_data.experience = json.loads(user_data.experience)
-      except json.JSONDecodeError:
-          print(f"Warning: Could not decode 'experience' as JSON for user {email}")
-          user_data.experience = []
-
-    if user_data.education:
-      try:
-        user_data.education = json.loads(user_data.education)
-      except json.JSONDecodeError:
-          print(f"Warning: Could not decode 'education' as JSON for user {email}")
-          user_data.education = []
-
-    if user_data.employer_jobs:
-        try:
-            for jobs in user_data.employer_jobs:
-                # jobs["match_json"] = json.loads(jobs["match_json"]) if jobs["match_json"] else {}
-                jobs.match_json = json.loads(jobs.match_json) if jobs.match_json else {}
-                jobs.jobs.desc_json = json.loads(jobs.jobs.desc_json) if jobs.jobs.desc_json else {}
-                jobs.jobs.responsibilities = json.loads(jobs.jobs.responsibilities) if jobs.jobs.responsibilities else []
-                jobs.jobs.skills = json.loads(jobs.jobs.skills) if jobs.jobs.skills else []
-        except json.JSONDecodeError:
-            print(f"Warning: Could not decode 'education' as JSON for user {email}")
-            user_data.education = []
-
-    return user_data
+    # JSONB columns come back decoded; only fill in the empty defaults the client
+    # expects, without marking the rows as changed
+    if not user_data.about:
+        set_committed_value(user_data, "about", {})
+
+    for application in user_data.employer_jobs:
+        if not application.match_json:
+            set_committed_value(application, "match_json", {})
+        application.jobs.fill_json_defaults()
+
+    response = model_response(UserResponse, user_data)
+    if etag:
+        response.headers["ETag"] = etag
+    return response
 
 # update user details using their email
 @router.post("/{email}/update")
@@ -161,7 +148,7 @@ def user_update(user_data: UserSchema, email: str, db: Session = Depends(get_db)
 #         # print(f"User with email {email} not found.")
 #         raise HTTPException(status_code=400, detail={result["error"]})
 
-    user_dict = user_data.dict_without_none()
+    user_dict = user_data.dict_for_update()
 
     if "skills" in user_dict:
         skills_data = user_dict.pop("skills")
@@ -180,9 +167,18 @@ def user_update(user_data: UserSchema, email: str, db: Session = Depends(get_db)
     return ({"ok": f"User with email {email} updated successfully."})
 
 @router.post("/{email}/upload")
-async def user_upload(email: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def user_upload(
+    email: str,
+    response: Response,
+    file: UploadFile = File(...),
+    background: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Upload and process a resume PDF file.
+    With `background`, the file is stored and processed by a background worker;
+    the reply is {"job_id", "status"} (202) and /{email}/upload/{job_id}
+    reports progress and the result.
     """
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
@@ -190,33 +186,37 @@ async def user_upload(email: str, file: UploadFile = File(...), db: Session = De
     try:
         # Read file contents
         contents = await file.read()
-        file_contents = BytesIO(contents)
 
-        # Create evaluator and process resume
-        evaluator = ResumeEvaluator()
-        result = await evaluator.evaluate_resume(file_contents)
+        if background:
+            user = await async_get_data(db, User, {"email": email}, options=load_profile(User, "minimal"))
+            if not user or isinstance(user, dict):
+                raise HTTPException(status_code=404, detail="User not found")
+            job = await async_insert_data(db, ResumeJob, {
+                "user_id": user[0].id,
+                "filename": file.filename,
+                "pdf": contents,
+                "status": "queued"
+            })
+            if isinstance(job, dict):
+                raise HTTPException(status_code=400, detail=job["error"])
+            enqueue_resume_job(job.id)
+            response.status_code = 202
+            return {"job_id": job.id, "status": job.status}
 
-        # Update user skills
-        skills_data = dict.fromkeys(result["skills"], 0)
-        update_user_skills(db, email, skills_data)
+        # Process the resume, the PDF is parsed in the process pool unless the
+        # same file was extracted before
+        evaluator = get_resume_evaluator()
+        result = await evaluator.evaluate_resume(contents, db)
 
-        # Update user information
-        update_result = update_data(db, User, {"email": email}, {
-            "name": result["name"],
-            "resume": file.filename,
-            "resume_base64": result["base64_string"],
-            "position": result["position"],
-            "location": result["location"],
-            "experience": result["experience"],
-            "education": result["education"],
-            "jobs": result["jobs"]
-        })
+        # Update user skills and information
+        await save_resume_skills(db, email, result["skills"])
+        update_result = await save_resume_profile(db, email, file.filename, result)
 
         if not update_result:
             raise HTTPException(status_code=400, detail="Failed to update user information")
 
         # Get and return the updated user data
-        updated_user = get_data(db, User, {"email": email})[0]
+        updated_user = (await async_get_data(db, User, {"email": email}, options=load_profile(User, "profile")))[0]
         return updated_user
 
     except HTTPException as http_ex:
@@ -225,23 +225,33 @@ async def user_upload(email: str, file: UploadFile = File(...), db: Session = De
         print(f"Error in user_upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing resume: {str(e)}")
 
+@router.get("/{email}/upload/{job_id}", response_model=ResumeJobResponse)
+@router.post("/{email}/upload/{job_id}", response_model=ResumeJobResponse)
+async def user_upload_status(email: str, job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Status of a background resume upload: queued, parsing, parsed, extracted, skills_saved, done or failed."""
+    job = (await db.execute(
+        select(ResumeJob)
+        .join(User, User.id == ResumeJob.user_id)
+        .where(ResumeJob.id == job_id, User.email == email)
+    )).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Resume job not found")
+    return model_response(ResumeJobResponse, job)
+
 
 @router.post("/{email}/evaluate", response_model=BatchEvaluationResponse)
-async def evaluate_responses(email: str, request: BatchRequest, db: Session = Depends(get_db)):
+async def evaluate_responses(email: str, request: BatchRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Evaluate multiple behavioral questions and responses in a single request.
     """
-    evaluator = BehaviorEvaluator()
+    evaluator = get_behavior_evaluator()
     try:
-        evaluations = []
-        for qr in request.responses:
-            result = await evaluator.evaluate_response(
-                question=qr.question,
-                response=qr.response
-            )
-            evaluations.append(result)
+        # questions are evaluated concurrently, failed ones come back as
+        # per-item errors in their place
+        evaluations = await evaluator.evaluate_batch(request.responses)
 
-        update_data(db, User, {"email": email}, {"about": json.dumps(evaluations)})
+        if any("error" not in evaluation for evaluation in evaluations):
+            await async_update_data(db, User, {"email": email}, {"about": evaluations})
 
         return {"evaluations": evaluations}
     except HTTPException as http_ex:
@@ -255,7 +265,7 @@ async def user_apply_job(
     email: str, 
     job: str, 
     force_evaluate: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Evaluate a job application by comparing the user's resume with job requirements.
@@ -272,29 +282,34 @@ async def user_apply_job(
     """
     try:
         # Get user and job data
-        user_id = get_data(db, User, {"email": email})[0].id
-        job_description = db.query(EmployerJobs.desc_json).filter(EmployerJobs.id == int(job)).first()
+        user = (await async_get_data(db, User, {"email": email}, options=[*load_profile(User, "minimal"), undefer(User.resume_base64)]))[0]
+        user_id = user.id
+        job_description = (await db.execute(
+            select(EmployerJobs.desc_json).filter(EmployerJobs.id == int(job))
+        )).first()
         if not job_description:
             raise HTTPException(status_code=404, detail="Job not found")
         
         # Check for existing application
-        existing_application = db.query(UserEmployerJobs).filter(
-            UserEmployerJobs.user_id == user_id,
-            UserEmployerJobs.employer_jobs_id == int(job)
-        ).first()
+        existing_application = (await db.execute(
+            select(UserEmployerJobs).filter(
+                UserEmployerJobs.user_id == user_id,
+                UserEmployerJobs.employer_jobs_id == int(job)
+            )
+        )).unique().scalars().first()
 
         # If there's an existing application with non-empty match_json and not forcing re-evaluation
-        if not force_evaluate and existing_application and existing_application.match_json and existing_application.match_json.strip():
-            return json.loads(existing_application.match_json)
+        if not force_evaluate and existing_application and existing_application.match_json:
+            return existing_application.match_json
 
         # If we need to evaluate, get the resume
-        job_description = json.loads(job_description[0])
-        resume = get_data(db, User, {"email": email})[0].resume_base64
+        job_description = job_description[0]
+        resume = user.resume_base64
         if not resume:
             raise HTTPException(status_code=400, detail="User resume not found")
 
-        # Create evaluator and get analysis
-        evaluator = JobEvaluator()
+        # Get analysis from the shared evaluator
+        evaluator = get_job_evaluator()
         result = await evaluator.evaluate_job_match(
             job_description=job_description,
             resume=resume
@@ -302,13 +317,13 @@ async def user_apply_job(
 
         # Delete any existing application
         if existing_application:
-            delete_data(db, UserEmployerJobs, {"id": existing_application.id})
+            await async_delete_data(db, UserEmployerJobs, {"id": existing_application.id})
 
         # Store the new application
-        db_result = insert_data(db, UserEmployerJobs, {
+        db_result = await async_insert_data(db, UserEmployerJobs, {
             "user_id": user_id,
             "employer_jobs_id": int(job),
-            "match_json": json.dumps(result, indent=2)
+            "match_json": result
         })
         if not db_result:
             raise HTTPException(status_code=400, detail="Failed to store job application")
@@ -324,15 +339,15 @@ async def user_apply_job(
 
 @router.post("/{email}/skill-assess")
 def user_skill_assess(email: str, db: Session = Depends(get_db)):
-    user_id = get_data(db, User, {"email": email})[0].id
+    user_id = get_data(db, User, {"email": email}, options=load_profile(User, "minimal"))[0].id
 
-    skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id})
+    skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id}, options=load_profile(UserSkillAssess, "minimal"))
     total_qs = len(skill_qs)
     if (isinstance(skill_qs, dict) and 'error' in skill_qs):
         total_qs = 0
     
     if total_qs < 5 or (isinstance(skill_qs, dict) and 'error' in skill_qs):
-        user_skill = get_data(db, UserSkills, {"user_id": user_id})
+        user_skill = get_data(db, UserSkills, {"user_id": user_id}, options=load_profile(UserSkills, "minimal"))
 
         for skill in user_skill:
             print(skill.name, " ", skill.level)
@@ -357,19 +372,20 @@ def user_skill_assess(email: str, db: Session = Depends(get_db)):
         ]
         # print(topics)
 
-        generator = SkillsetGenerator()
+        generator = get_skillset_generator()
         result = generator.generate(topics, 10-total_qs)
-        for qs in result['questions']:
-            insert_data(db, UserSkillAssess, {
+        insert_many(db, UserSkillAssess, [
+            {
                 "user_id": user_id,
                 "qs_type": qs['topic'],
                 "question": qs['question'],
                 "option": qs['options'],
                 "answer_real": qs['answer'],
                 "qs_level": qs['level']
-            })
+            } for qs in result['questions']
+        ])
 
-        skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id})
+        skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id}, options=load_profile(UserSkillAssess, "minimal"))
 
     return skill_qs
 
@@ -390,7 +406,7 @@ def user_skill_assess_save(email: str, db: Session = Depends(get_db), answers: O
     Returns:
         Updated skill assessments for the user.
     """
-    user_id = get_data(db, User, {"email": email})[0].id
+    user_id = get_data(db, User, {"email": email}, options=load_profile(User, "minimal"))[0].id
 
     # Update the UserSkillAssess table with the provided answers
     if answers:
@@ -399,7 +415,7 @@ def user_skill_assess_save(email: str, db: Session = Depends(get_db), answers: O
             if not result:
                 raise HTTPException(status_code=400, detail=f"Failed to update skill assessment with id {skill_id}")
         
-    skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id})
+    skill_qs = get_data(db, UserSkillAssess, {"user_id": user_id}, options=load_profile(UserSkillAssess, "minimal"))
 
     # Calculate the number of correct answers
     total_qs = len(skill_qs)